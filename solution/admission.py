@@ -0,0 +1,158 @@
+"""
+Admission control for the simple MCP server: which requests to take on.
+
+- RateLimiter: a token bucket per client, refilled at `rate` requests per
+  second up to `burst`; a client over its rate gets 429 + Retry-After
+- AdmissionControl: the rate limiter plus a cap on requests in flight in
+  this process (503 + Retry-After beyond it), and per-client counters of
+  admitted and rejected requests for /_mcp/clients
+
+A client is its API key (X-API-Key, or an Authorization bearer token;
+only a hash of it is kept) or else its IP address. Checks run as soon as a
+request's headers are parsed, before the body is read or parsed, and cost a
+couple of dict operations under a lock, so turning a request away stays
+far cheaper than serving it. In multi-process mode every worker process
+enforces its own limits.
+"""
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+API_KEY_HEADER = "X-API-Key"
+OVERLOAD_RETRY_AFTER = 1  # seconds suggested to clients rejected with 503
+MAX_CLIENTS = 10_000  # clients tracked; the least recently seen are forgotten
+
+ADMITTED, RATE_LIMITED, OVERLOADED = "admitted", "rate_limited", "overloaded"
+OUTCOMES = (ADMITTED, RATE_LIMITED, OVERLOADED)
+
+
+def client_identity(headers, client_address):
+    """The key a request is limited and counted under: "key:<hash>" or "addr:<ip>" """
+    key = headers.get(API_KEY_HEADER)
+    if not key:
+        scheme, _, token = (headers.get("Authorization") or "").partition(" ")
+        key = token.strip() if scheme.lower() == "bearer" else None
+    if key:
+        return "key:" + hashlib.sha256(key.encode()).hexdigest()[:16]
+    return "addr:" + str(client_address[0] if client_address else "unknown")
+
+
+class RateLimiter:
+    """Token bucket per client: `rate` requests/second, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None, max_clients=MAX_CLIENTS):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()  # client -> [tokens, time of last refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, client):
+        """0.0 if `client` may make a request now (taking a token), else seconds to wait"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = [float(self.burst), now]
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return 0.0
+            return (1 - bucket[0]) / self.rate
+
+
+class AdmissionControl:
+    """
+    Per-client rate limit (rate <= 0: none) and a cap on requests in flight
+    (max_in_flight <= 0: none), with per-client counters
+    """
+
+    def __init__(self, rate=0.0, burst=None, max_in_flight=0, max_clients=MAX_CLIENTS):
+        self.max_in_flight = max_in_flight
+        self.max_clients = max_clients
+        self.in_flight = 0
+        self.rate_limiter = None
+        self.configure(rate, burst)
+        self.totals = dict.fromkeys(OUTCOMES, 0)
+        self._clients = OrderedDict()  # client -> {outcome: count}
+        self._lock = threading.Lock()
+
+    def configure(self, rate, burst=None):
+        """Set the per-client rate limit (rate <= 0 turns it off)"""
+        self.rate_limiter = RateLimiter(rate, burst, self.max_clients) if rate > 0 else None
+
+    @property
+    def enabled(self):
+        return self.rate_limiter is not None or self.max_in_flight > 0
+
+    def try_enter(self):
+        """Take an in-flight slot; False (and counted) if all max_in_flight are taken"""
+        with self._lock:
+            if 0 < self.max_in_flight <= self.in_flight:
+                self.totals[OVERLOADED] += 1
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self):
+        """Give back a slot taken by try_enter() or admit()"""
+        with self._lock:
+            self.in_flight -= 1
+
+    def admit(self, client, enter=True):
+        """
+        None if `client`'s request may go ahead, else (status, retry_after):
+        503 when max_in_flight requests are already running, 429 when the
+        client is over its rate. An admitted request holds an in-flight slot
+        (unless enter=False: the caller already holds one) until leave().
+        """
+        with self._lock:
+            if enter and 0 < self.max_in_flight <= self.in_flight:
+                self._count(client, OVERLOADED)
+                return 503, OVERLOAD_RETRY_AFTER
+            wait = self.rate_limiter.acquire(client) if self.rate_limiter is not None else 0.0
+            if wait:
+                self._count(client, RATE_LIMITED)
+                return 429, wait
+            if enter:
+                self.in_flight += 1
+            self._count(client, ADMITTED)
+            return None
+
+    def _count(self, client, outcome):
+        self.totals[outcome] += 1
+        counts = self._clients.get(client)
+        if counts is None:
+            counts = self._clients[client] = dict.fromkeys(OUTCOMES, 0)
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(client)
+        counts[outcome] += 1
+
+    def stats(self, top=100):
+        """Limits, totals and the `top` busiest clients' counters"""
+        with self._lock:
+            clients = [(client, dict(counts)) for client, counts in self._clients.items()]
+            totals = dict(self.totals)
+            in_flight = self.in_flight
+        clients.sort(key=lambda item: sum(item[1].values()), reverse=True)
+        limiter = self.rate_limiter
+        return {
+            "rate": limiter.rate if limiter else None,
+            "burst": limiter.burst if limiter else None,
+            "max_in_flight": self.max_in_flight or None,
+            "in_flight": in_flight,
+            "totals": totals,
+            "clients_tracked": len(clients),
+            "clients": dict(clients[:top]),
+        }
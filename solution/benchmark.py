@@ -0,0 +1,889 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the simple MCP server.
+Standard library only, run from the solution/ folder:
+
+    python benchmark.py load --modes single threaded async --clients 1 2 4 8 16
+    python benchmark.py keepalive --calls 2000
+    python benchmark.py vectorized --sizes 100 10000 1000000
+    python benchmark.py pipeline --model-latency 0.2 --concurrency 1 4 16
+    python benchmark.py prompt --tools 2 50 500
+    python benchmark.py transport --calls 5000
+    python benchmark.py workers --workers 1 2 4 --size 20000
+    python benchmark.py compression --tools 2 100 1000 --sizes 10 1000 100000
+    python benchmark.py startup --runs 10
+    python benchmark.py admission --mode threaded async
+    python benchmark.py suite --json results.json --baseline baseline.json
+
+The pipeline and prompt benchmarks use the real client (it needs `requests`) against
+the mock model backend, so they run offline.
+
+`suite` is the one to run across commits: it covers the HTTP endpoints and the
+JSON / prompt hot paths, writes machine-readable results (tagged with the git
+revision) and, given the results of an earlier run as --baseline, flags every
+case that got slower by more than --tolerance and exits non-zero.
+"""
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+import timeit
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import content_encoding
+from admission import AdmissionControl
+from jsonrpc import StdioClient
+from simple_mcp_server import MCPHandler, SERVER_MODES, make_server, registry
+from serialization import json_dumps, msgpack_dumps, msgpack_loads
+from tool_registry import encode_result
+
+
+class QuietMCPHandler(MCPHandler):
+    """MCPHandler without the per-request access log (it skews the numbers)."""
+
+    def log_message(self, format, *args):
+        pass
+
+
+class HTTP10MCPHandler(QuietMCPHandler):
+    """The server as it was before keep-alive: one request per connection."""
+    protocol_version = "HTTP/1.0"
+
+
+def start_server(mode, handler_class=QuietMCPHandler, **kwargs):
+    """Start a server on a free local port in a background thread."""
+    server = make_server(mode, port=0, host="127.0.0.1", handler_class=handler_class, **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, thread
+
+
+def stop_server(server, thread):
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not samples:
+        return 0.0
+    index = min(len(samples) - 1, max(0, round(pct / 100 * len(samples)) - 1))
+    return samples[index]
+
+
+def latency_stats(latencies):
+    """Mean and p50/p95/p99 of a list of seconds, in milliseconds."""
+    latencies = sorted(latencies)
+    return {
+        "mean_ms": sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+def post_add(address, client_delay=0.0):
+    """
+    One POST /add over a raw socket. `client_delay` pauses between the headers
+    and the body to simulate a slow client holding its connection open.
+    """
+    body = b'{"a": 5, "b": 3}'
+    head = (
+        "POST /add HTTP/1.1\r\n"
+        "Host: localhost\r\n"
+        "Content-Type: application/json\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        "Connection: close\r\n\r\n"
+    ).encode()
+    with socket.create_connection(address) as sock:
+        sock.sendall(head)
+        if client_delay:
+            time.sleep(client_delay)
+        sock.sendall(body)
+        response = b""
+        while chunk := sock.recv(65536):
+            response += chunk
+    return response.startswith(b"HTTP/1.") and b" 200 " in response.split(b"\r\n", 1)[0]
+
+
+def run_load(address, clients, duration, client_delay=0.0):
+    """Drive `clients` concurrent connections for `duration` seconds."""
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        local_latencies, local_errors = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                ok = post_add(address, client_delay)
+            except OSError:
+                ok = False
+            local_latencies.append(time.perf_counter() - start)
+            local_errors += not ok
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        **latency_stats(latencies),
+    }
+
+
+def cmd_load(args):
+    """Throughput vs. client count for each server mode."""
+    print(f"{'mode':<10}{'clients':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode in args.modes:
+        server, thread = start_server(mode, max_concurrency=args.max_concurrency,
+                                      backlog=args.backlog)
+        try:
+            for clients in args.clients:
+                stats = run_load(server.server_address, clients, args.duration, args.client_delay)
+                print(f"{mode:<10}{clients:>8}{stats['throughput_rps']:>10.1f}"
+                      f"{stats['p50_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+        finally:
+            stop_server(server, thread)
+
+
+def sequential_calls(address, calls, reuse):
+    """Latency of `calls` back-to-back POST /add, optionally on one connection."""
+    host, port = address[:2]
+    body = json.dumps({"a": 5, "b": 3})
+    headers = {"Content-Type": "application/json"}
+    conn = None
+    latencies = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        if conn is None:
+            conn = http.client.HTTPConnection(host, port)
+        conn.request("POST", "/add", body, headers)
+        response = conn.getresponse()
+        response.read()
+        if not reuse or response.will_close:
+            conn.close()
+            conn = None
+        latencies.append(time.perf_counter() - start)
+    if conn is not None:
+        conn.close()
+    latencies.sort()
+    return latencies
+
+
+def cmd_keepalive(args):
+    """Per-call latency for many sequential tool calls, before/after keep-alive."""
+    cases = [
+        ("HTTP/1.0, new connection per call", HTTP10MCPHandler, False),
+        ("HTTP/1.1 keep-alive, reused connection", QuietMCPHandler, True),
+    ]
+    print(f"{'case':<42}{'mean ms':>10}{'p50 ms':>10}{'p99 ms':>10}")
+    for label, handler_class, reuse in cases:
+        server, thread = start_server(args.mode, handler_class=handler_class)
+        try:
+            latencies = sequential_calls(server.server_address, args.calls, reuse)
+        finally:
+            stop_server(server, thread)
+        mean = sum(latencies) / len(latencies)
+        print(f"{label:<42}{mean * 1000:>10.3f}{percentile(latencies, 50) * 1000:>10.3f}"
+              f"{percentile(latencies, 99) * 1000:>10.3f}")
+
+
+def timed_post(conn, path, payload):
+    """POST JSON on an open connection; returns (seconds, response bytes)"""
+    start = time.perf_counter()
+    conn.request("POST", path, json.dumps(payload), {"Content-Type": "application/json"})
+    response = conn.getresponse()
+    body = response.read()
+    elapsed = time.perf_counter() - start
+    if response.status != 200:
+        raise RuntimeError(f"{path} returned {response.status}: {body[:200]!r}")
+    return elapsed, body
+
+
+def cmd_vectorized(args):
+    """N scalar /add calls vs. one array /add call (JSON and packed float64)."""
+    server, thread = start_server("threaded")
+    conn = http.client.HTTPConnection(*server.server_address[:2])
+    try:
+        # Per-call cost of a scalar call, used to estimate N beyond --max-scalar-calls
+        sample = min(args.max_scalar_calls, 2000)
+        per_call = sum(timed_post(conn, "/add", {"a": i, "b": 0.5})[0]
+                       for i in range(sample)) / sample
+
+        print(f"{'N':>9}{'scalar s':>12}{'array s':>10}{'f64 s':>10}"
+              f"{'speedup':>10}{'json KB':>10}{'f64 KB':>10}")
+        for n in args.sizes:
+            if n <= args.max_scalar_calls:
+                scalar = sum(timed_post(conn, "/add", {"a": i, "b": 0.5})[0] for i in range(n))
+                scalar_label = f"{scalar:.3f}"
+            else:
+                scalar = n * per_call
+                scalar_label = f"~{scalar:.1f}"
+            rng = random.Random(n)
+            payload = {"a": [rng.random() * 1000 for _ in range(n)], "b": 0.5}
+            array_time, array_body = timed_post(conn, "/add", payload)
+            f64_time, f64_body = timed_post(conn, "/add?encoding=f64", payload)
+            print(f"{n:>9}{scalar_label:>12}{array_time:>10.3f}{f64_time:>10.3f}"
+                  f"{scalar / array_time:>9.0f}x{len(array_body) / 1024:>10.1f}"
+                  f"{len(f64_body) / 1024:>10.1f}")
+        print("~ = estimated from the mean cost of a scalar call")
+    finally:
+        conn.close()
+        stop_server(server, thread)
+
+
+def cmd_pipeline(args):
+    """Client + server pipeline with the mock model: throughput and own overhead."""
+    import simple_mcp_client_model as client
+    from model_backends import MockBackend
+
+    server, thread = start_server("threaded", max_concurrency=max(args.concurrency))
+    try:
+        client.base_url = "http://%s:%d" % server.server_address[:2]
+        client.POOL_SIZE = max(client.POOL_SIZE, max(args.concurrency))
+        client.set_model_backend(MockBackend(latency=args.model_latency))
+        client.discover_tools()
+        questions = [f"add {i} and {i + 1}" if i % 2 else f"what is {i} minus 3"
+                     for i in range(args.questions)]
+
+        print(f"{'concurrency':>12}{'q/s':>10}{'mean s':>10}{'overhead ms':>13}{'errors':>8}")
+        for concurrency in args.concurrency:
+            started = time.perf_counter()
+            records = asyncio.run(client.answer_questions_async(questions, concurrency))
+            elapsed = time.perf_counter() - started
+            errors = sum(1 for r in records if "error" in r or "error" in (r.get("result") or {}))
+            mean = sum(r["elapsed_s"] for r in records) / len(records)
+            # Everything except the (simulated) model call: prompt, tool call, bookkeeping
+            overhead = sum(r["elapsed_s"] - r.get("model_s", 0) for r in records) / len(records)
+            print(f"{concurrency:>12}{len(records) / elapsed:>10.1f}{mean:>10.3f}"
+                  f"{overhead * 1000:>13.2f}{errors:>8}")
+    finally:
+        stop_server(server, thread)
+
+
+def synthetic_tools(count):
+    """`count` tool definitions shaped like the server's, for prompt sizing"""
+    base = registry.manifest.tools
+    tools = list(base[:count])
+    for i in range(len(tools), count):
+        tools.append({
+            "name": f"tool_{i}",
+            "description": f"Synthetic tool number {i} for prompt benchmarks.",
+            "parameters": {
+                "type": "object",
+                "properties": {"x": {"type": "number"}, "label": {"type": "string"}},
+                "required": ["x"],
+            },
+        })
+    return tools
+
+
+def cmd_prompt(args):
+    """build_dynamic_prompt size and build time per rendering mode."""
+    import simple_mcp_client_model as client
+
+    question = "What is 12 plus 30?"
+    print(f"{'tools':>6}{'mode':>9}{'bytes':>10}{'~tokens':>9}{'cold us':>10}{'warm us':>10}")
+    for count in args.tools:
+        tools = synthetic_tools(count)
+        # As if discovered from a server: the cache is keyed on its ETag
+        client._manifest_cache.update(tools=tools, etag=f'"bench-{count}"')
+        for mode in client.PROMPT_MODES:
+            client._rendered_tools.clear()
+            start = time.perf_counter()
+            prompt = client.build_dynamic_prompt(question, tools, mode)
+            cold = time.perf_counter() - start
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                client.build_dynamic_prompt(question, tools, mode)
+            warm = (time.perf_counter() - start) / args.repeat
+            size = len(prompt.encode())
+            print(f"{count:>6}{mode:>9}{size:>10}{size // 4:>9}{cold * 1e6:>10.0f}{warm * 1e6:>10.1f}")
+    print(f"~tokens = bytes / 4; prompts list at most MAX_PROMPT_TOOLS={client.MAX_PROMPT_TOOLS} tools")
+
+
+def cmd_transport(args):
+    """Per-call overhead of JSON-RPC over stdio vs. HTTP keep-alive."""
+    arguments = {"a": 5, "b": 3}
+    results = []
+
+    server, thread = start_server("threaded")
+    try:
+        latencies = sequential_calls(server.server_address, args.calls, reuse=True)
+    finally:
+        stop_server(server, thread)
+    results.append(("HTTP keep-alive, sequential", sum(latencies), latencies))
+
+    command = [sys.executable, "simple_mcp_server.py", "--transport", "stdio",
+               "--rpc-workers", str(args.rpc_workers)]
+    with StdioClient(command) as client:
+        client.initialize()
+        params = {"name": "add", "arguments": arguments}
+
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(args.calls):
+            start = time.perf_counter()
+            client.call("tools/call", params)
+            latencies.append(time.perf_counter() - start)
+        results.append(("stdio, sequential", time.perf_counter() - started, sorted(latencies)))
+
+        # Pipelined: keep up to --window requests in flight
+        started = time.perf_counter()
+        in_flight = []
+        for _ in range(args.calls):
+            in_flight.append(client.request("tools/call", params))
+            if len(in_flight) >= args.window:
+                in_flight.pop(0).result()
+        for future in in_flight:
+            future.result()
+        results.append((f"stdio, pipelined (window {args.window})", time.perf_counter() - started, None))
+
+        started = time.perf_counter()
+        for i in range(0, args.calls, args.window):
+            batch = [("tools/call", params)] * min(args.window, args.calls - i)
+            for future in client.batch(batch):
+                future.result()
+        results.append((f"stdio, batches of {args.window}", time.perf_counter() - started, None))
+
+    print(f"{'case':<36}{'calls/s':>10}{'us/call':>10}{'p50 us':>10}{'p99 us':>10}")
+    for label, elapsed, latencies in results:
+        p50 = f"{percentile(latencies, 50) * 1e6:.0f}" if latencies else "-"
+        p99 = f"{percentile(latencies, 99) * 1e6:.0f}" if latencies else "-"
+        print(f"{label:<36}{args.calls / elapsed:>10.0f}{elapsed / args.calls * 1e6:>10.1f}{p50:>10}{p99:>10}")
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(address, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(address, timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server on {address} did not start")
+
+
+def cmd_workers(args):
+    """CPU-heavy calls (large arrays) against 1..N pre-forked worker processes."""
+    body = request_body("POST", args.size)
+    print(f"{os.cpu_count()} CPU(s); POST /add with {args.size}-float arrays, "
+          f"{args.clients_per_worker} clients per worker")
+    print(f"{'workers':>8}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'scaling':>9}")
+    baseline = None
+    for workers in args.workers:
+        port = free_port()
+        process = subprocess.Popen(
+            [sys.executable, "simple_mcp_server.py", "--port", str(port), "--workers", str(workers),
+             "--mode", args.mode, "--access-log-sample", "0", "--result-cache-entries", "0"],
+            stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(("127.0.0.1", port))
+            stats = drive(("127.0.0.1", port), "POST", "/add", body,
+                          workers * args.clients_per_worker, args.duration, reuse=True)
+        finally:
+            process.terminate()
+            process.wait()
+        baseline = baseline or stats["throughput_rps"] / workers
+        print(f"{workers:>8}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['errors']:>8}"
+              f"{stats['throughput_rps'] / baseline:>8.2f}x")
+
+
+def compression_payloads(tool_counts, sizes):
+    """(label, bytes) for manifests, array results and batch responses of each size"""
+    payloads = [(f"manifest, {count} tools", json_dumps(synthetic_tools(count))) for count in tool_counts]
+    rng = random.Random(0)
+    for size in sizes:
+        values = [rng.random() * 1000 for _ in range(size)]
+        payloads.append((f"result, {size} floats", json_dumps({"result": values, "timestamp": "x" * 20})))
+    for size in sizes:
+        batch = [{"result": i + 0.5, "timestamp": "2025-01-01T00:00:00.000000+00:00"} for i in range(size)]
+        payloads.append((f"batch, {size} results", json_dumps({"results": batch})))
+    return payloads
+
+
+def cmd_compression(args):
+    """Bytes on the wire and CPU per response for each content coding."""
+    print(f"codings: {', '.join(content_encoding.CODECS)}; the server compresses "
+          f"responses of at least {MCPHandler.compress_min_size} bytes")
+    print(f"{'payload':<26}{'coding':>7}{'bytes':>11}{'ratio':>8}{'compress us':>13}"
+          f"{'decompress us':>15}{'MB/s':>8}")
+    for label, body in compression_payloads(args.tools, args.sizes):
+        print(f"{label:<26}{'-':>7}{len(body):>11}")
+        for coding in content_encoding.CODECS:
+            packed = content_encoding.compress(body, coding)
+            compress = micro("", lambda: content_encoding.compress(body, coding), args.repeat)
+            decompress = micro("", lambda: content_encoding.decompress(packed, coding), args.repeat)
+            print(f"{'':<26}{coding:>7}{len(packed):>11}{len(body) / len(packed):>7.1f}x"
+                  f"{compress['us_per_op']:>13.1f}{decompress['us_per_op']:>15.1f}"
+                  f"{len(body) / compress['us_per_op']:>8.0f}")
+    print("MB/s = uncompressed bytes compressed per second; the manifest is compressed once "
+          "per coding and cached, other responses on every request")
+
+
+def cmd_admission(args):
+    """What admission control costs on admitted requests, and what a rejection costs."""
+    scalar = request_body("POST", 0)
+    heavy = request_body("POST", args.size)
+    cases = [
+        # (label, admission settings, body, clients, keep-alive)
+        ("no admission control", {}, scalar, args.clients, True),
+        ("rate limit, all admitted", {"rate": 1e9}, scalar, args.clients, True),
+        ("rate limit, all rejected (429)", {"rate": 1e-9, "burst": 1}, scalar, args.clients, True),
+        ("no admission control, close", {}, scalar, args.clients, False),
+        (f"{args.size}-float calls, no cap", {}, heavy, args.overload_clients, True),
+        (f"{args.size}-float calls, max {args.max_in_flight} in flight",
+         {"max_in_flight": args.max_in_flight}, heavy, args.overload_clients, True),
+    ]
+    print(f"{'mode':<10}{'case':<40}{'req/s':>10}{'200s':>8}{'rejected':>10}{'p50 ms':>9}{'p99 ms':>9}")
+    for mode in args.modes:
+        for label, settings, body, clients, reuse in cases:
+            handler = type("AdmissionBenchHandler", (QuietMCPHandler,), {"admission": AdmissionControl(**settings)})
+            server, thread = start_server(mode, handler, max_concurrency=max(32, clients))
+            try:
+                stats = drive(server.server_address, "POST", "/add", body, clients, args.duration, reuse)
+            finally:
+                stop_server(server, thread)
+            totals = handler.admission.totals
+            rejected = totals["rate_limited"] + totals["overloaded"]
+            print(f"{mode:<10}{label:<40}{stats['throughput_rps']:>10.0f}"
+                  f"{stats['requests'] - stats['errors']:>8}{rejected:>10}"
+                  f"{stats['p50_ms']:>9.2f}{stats['p99_ms']:>9.2f}")
+    print("Rejected requests with a body close their connection (the body is never read), "
+          "so compare 429s with the 'close' case")
+
+
+# Process start-up: an empty interpreter, then each entry point's import
+STARTUP_CASES = {
+    "python -c pass": "pass",
+    "import simple_mcp_client_model": "import simple_mcp_client_model",
+    "import simple_mcp_server": "import simple_mcp_server",
+}
+
+
+def run_python(code, *options):
+    """Seconds for a fresh interpreter to run `code` (and its stderr)"""
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, *options, "-c", code], capture_output=True, text=True,
+                            env={**os.environ, "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "x")})
+    elapsed = time.perf_counter() - started
+    if result.returncode:
+        raise RuntimeError(f"python -c {code!r} failed:\n{result.stderr}")
+    return elapsed, result.stderr
+
+
+def startup_benchmarks(runs):
+    """Median wall time per STARTUP_CASES entry over `runs` fresh processes."""
+    results = []
+    for name, code in STARTUP_CASES.items():
+        run_python(code)  # warm the OS file cache and __pycache__
+        times = sorted(run_python(code)[0] for _ in range(runs))
+        median = times[len(times) // 2]
+        results.append({"name": f"startup: {name}", "us_per_op": median * 1e6, "ops_per_s": 1 / median})
+    return results
+
+
+def import_breakdown(module, runs):
+    """
+    Mean `python -X importtime` cost (self, cumulative us) of each module
+    `module` imports directly, over `runs` fresh processes.
+    """
+    totals = {}
+    for _ in range(runs):
+        _, stderr = run_python(f"import {module}", "-X", "importtime")
+        children = {}
+        for line in stderr.splitlines():
+            # "import time: <self us> | <cumulative us> | <2 spaces per level><name>";
+            # children are listed before the module that imports them
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            prefix, cumulative_us, name = line.split("|")
+            self_us = prefix.split(":")[1]
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            name = name.strip()
+            if depth == 0:
+                if name == module:
+                    break
+                children = {}  # site, encodings, ...: imported before `module`
+            elif depth == 1:
+                children[name] = (int(self_us), int(cumulative_us))
+        for name, (self_us, cumulative_us) in children.items():
+            total = totals.setdefault(name, [0, 0])
+            total[0] += self_us
+            total[1] += cumulative_us
+    return sorted(((name, s / runs, c / runs) for name, (s, c) in totals.items()),
+                  key=lambda item: item[2], reverse=True)
+
+
+def cmd_startup(args):
+    """Process start-up time per entry point, and what the client's import spends it on."""
+    print(f"{'case':<46}{'median ms':>11}")
+    for case in startup_benchmarks(args.runs):
+        print(f"{case['name']:<46}{case['us_per_op'] / 1000:>11.1f}")
+    print(f"\npython -X importtime {args.module} (mean of {args.runs} runs)")
+    print(f"{'module':<46}{'self ms':>9}{'total ms':>10}")
+    for name, self_us, cumulative_us in import_breakdown(args.module, args.runs)[:args.top]:
+        print(f"{name:<46}{self_us / 1000:>9.2f}{cumulative_us / 1000:>10.2f}")
+
+
+# --- suite: repeatable, machine-readable, comparable across commits ---
+
+ENDPOINTS = {
+    "add": ("POST", "/add"),
+    "substract": ("POST", "/substract"),
+    "tools": ("GET", "/_mcp/tools"),
+}
+
+
+def request_body(method, size):
+    """JSON body for a tool call: scalars for size 0, else `size` floats for a"""
+    if method == "GET":
+        return None
+    if size == 0:
+        return json.dumps({"a": 5, "b": 3}).encode()
+    rng = random.Random(size)
+    return json.dumps({"a": [rng.random() * 1000 for _ in range(size)], "b": 0.5}).encode()
+
+
+def drive(address, method, path, body, concurrency, duration, reuse):
+    """
+    `concurrency` clients sending the same request back to back for
+    `duration` seconds, each on its own connection (kept open when `reuse`).
+    """
+    host, port = address[:2]
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        nonlocal errors
+        local_latencies, local_errors = [], 0
+        conn = None
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                if conn is None:
+                    conn = http.client.HTTPConnection(host, port, timeout=10)
+                conn.request(method, path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                ok = response.status == 200
+                if not reuse or response.will_close:
+                    conn.close()
+                    conn = None
+            except (OSError, http.client.HTTPException):
+                ok = False
+                if conn is not None:
+                    conn.close()
+                    conn = None
+            local_latencies.append(time.perf_counter() - start)
+            local_errors += not ok
+        if conn is not None:
+            conn.close()
+        with lock:
+            latencies.extend(local_latencies)
+            errors += local_errors
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "throughput_rps": len(latencies) / elapsed,
+        **latency_stats(latencies),
+    }
+
+
+def micro(name, func, repeat=5):
+    """Best-of-`repeat` time per call of `func`, timeit-style."""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    best = min(timer.repeat(repeat=repeat, number=number)) / number
+    return {"name": name, "us_per_op": best * 1e6, "ops_per_s": 1 / best}
+
+
+def micro_benchmarks(repeat):
+    """JSON encode/decode on the server's hot paths, plus prompt building."""
+    scalar_body = request_body("POST", 0)
+    array_body = request_body("POST", 1000)
+    array_value = json.loads(array_body)["a"]
+    packed_array = msgpack_dumps(array_value)
+    add = registry.get("add")
+    results = [
+        micro("json.loads scalar request", lambda: json.loads(scalar_body), repeat),
+        micro("json.loads 1000-float request", lambda: json.loads(array_body), repeat),
+        micro("encode_result scalar", lambda: encode_result(8), repeat),
+        micro("encode_result 1000 floats", lambda: encode_result(array_value), repeat),
+        micro("evaluate add scalar (cached)", lambda: add.evaluate({"a": 5, "b": 3}), repeat),
+        micro("evaluate add 1000 floats", lambda: add.evaluate({"a": array_value, "b": 0.5}), repeat),
+        micro("json.dumps manifest", lambda: json.dumps(registry.manifest.tools), repeat),
+        micro("json.dumps(separators=...) scalar result",
+              lambda: json.dumps({"result": 8}, separators=(",", ":")), repeat),
+        micro("json_dumps scalar result (shared encoder)", lambda: json_dumps({"result": 8}), repeat),
+        micro("msgpack_dumps scalar result", lambda: msgpack_dumps({"result": 8}), repeat),
+        micro("msgpack_dumps 1000 floats", lambda: msgpack_dumps(array_value), repeat),
+        micro("msgpack_loads 1000 floats", lambda: msgpack_loads(packed_array), repeat),
+    ]
+    try:
+        import simple_mcp_client_model as client
+    except ImportError as e:  # the client needs requests / python-dotenv
+        print(f"⚠️  Skipping prompt micro-benchmarks: {e}", file=sys.stderr)
+        return results
+    question = "What is 12 plus 30?"
+    for count in (2, 100):
+        tools = synthetic_tools(count)
+        client._manifest_cache.update(tools=tools, etag=f'"bench-{count}"')
+        for mode in client.PROMPT_MODES:
+            results.append(micro(f"build_dynamic_prompt {mode} {count} tools",
+                                 lambda: client.build_dynamic_prompt(question, tools, mode), repeat))
+    return results
+
+
+def git_revision():
+    """(short commit hash, uncommitted changes?) or (None, None) outside git"""
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return rev, bool(dirty)
+
+
+# Metrics compared against a baseline, and whether higher is better
+COMPARED = {"throughput_rps": True, "p50_ms": False, "p99_ms": False, "us_per_op": False}
+
+
+def compare(results, baseline, tolerance):
+    """Cases in `results` that are worse than in `baseline` by more than `tolerance`."""
+    previous = {case["name"]: case for section in ("http", "micro") for case in baseline.get(section, [])}
+    regressions = []
+    for section in ("http", "micro"):
+        for case in results[section]:
+            old = previous.get(case["name"])
+            if old is None:
+                continue
+            for metric, higher_is_better in COMPARED.items():
+                if metric not in case or not old.get(metric):
+                    continue
+                change = case[metric] / old[metric] - 1
+                worse = -change if higher_is_better else change
+                if worse > tolerance:
+                    regressions.append((case["name"], metric, old[metric], case[metric], change))
+    return regressions
+
+
+def cmd_suite(args):
+    """Endpoints x payload sizes x concurrency x connection reuse, plus micro-benchmarks."""
+    rev, dirty = git_revision()
+    results = {
+        "meta": {
+            "git_rev": rev,
+            "git_dirty": dirty,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "args": {k: v for k, v in vars(args).items() if k != "func"},
+        },
+        "http": [],
+        "micro": [],
+    }
+
+    if args.url:
+        url = urlparse(args.url)
+        address, server = (url.hostname, url.port or 80), None
+    else:
+        server, thread = start_server(args.mode, max_concurrency=max(max(args.concurrency), 32))
+        address = server.server_address
+    try:
+        print(f"{'case':<46}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}")
+        for endpoint in args.endpoints:
+            method, path = ENDPOINTS[endpoint]
+            for size in (args.payload_sizes if method == "POST" else [0]):
+                body = request_body(method, size)
+                for reuse in args.reuse:
+                    for concurrency in args.concurrency:
+                        name = (f"{method} {path} size={size} c={concurrency} "
+                                f"{'keepalive' if reuse == 'on' else 'close'}")
+                        stats = drive(address, method, path, body, concurrency,
+                                      args.duration, reuse == "on")
+                        results["http"].append({"name": name, "endpoint": endpoint, "payload_size": size,
+                                                "concurrency": concurrency, "reuse": reuse == "on", **stats})
+                        print(f"{name:<46}{stats['throughput_rps']:>10.1f}{stats['p50_ms']:>9.3f}"
+                              f"{stats['p95_ms']:>9.3f}{stats['p99_ms']:>9.3f}{stats['errors']:>8}")
+    finally:
+        if server is not None:
+            stop_server(server, thread)
+
+    if args.micro_repeat > 0:
+        print(f"\n{'micro-benchmark':<46}{'us/op':>10}{'ops/s':>14}")
+        results["micro"] = micro_benchmarks(args.micro_repeat)
+        if args.startup_runs > 0:
+            results["micro"] += startup_benchmarks(args.startup_runs)
+        for case in results["micro"]:
+            print(f"{case['name']:<46}{case['us_per_op']:>10.2f}{case['ops_per_s']:>14.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Results for {rev or 'unknown revision'}{' (dirty)' if dirty else ''} written to {args.json}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        against = baseline.get("meta", {}).get("git_rev") or args.baseline
+        if not regressions:
+            print(f"✅ No regressions beyond {args.tolerance:.0%} against {against}")
+            return 0
+        print(f"❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%} against {against}:")
+        for name, metric, old, new, change in regressions:
+            print(f"   {name} {metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+        return 1
+    return 0
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="MCP server benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    load = commands.add_parser("load", help="throughput vs. concurrent clients per server mode")
+    load.add_argument("--modes", nargs="+", choices=SERVER_MODES, default=list(SERVER_MODES))
+    load.add_argument("--clients", nargs="+", type=int, default=[1, 2, 4, 8, 16, 32])
+    load.add_argument("--duration", type=float, default=2.0, help="seconds per data point")
+    load.add_argument("--client-delay", type=float, default=0.01,
+                      help="seconds each client waits between headers and body")
+    load.add_argument("--max-concurrency", type=int, default=32)
+    load.add_argument("--backlog", type=int, default=128)
+    load.set_defaults(func=cmd_load)
+
+    keepalive = commands.add_parser("keepalive", help="sequential call latency with/without keep-alive")
+    keepalive.add_argument("--calls", type=int, default=2000)
+    keepalive.add_argument("--mode", choices=SERVER_MODES, default="threaded")
+    keepalive.set_defaults(func=cmd_keepalive)
+
+    vectorized = commands.add_parser("vectorized", help="N scalar calls vs. one array call")
+    vectorized.add_argument("--sizes", nargs="+", type=int,
+                            default=[10, 100, 1000, 10_000, 100_000, 1_000_000])
+    vectorized.add_argument("--max-scalar-calls", type=int, default=10_000,
+                            help="larger N are estimated from the per-call cost")
+    vectorized.set_defaults(func=cmd_vectorized)
+
+    pipeline = commands.add_parser("pipeline", help="client+server pipeline with the mock model")
+    pipeline.add_argument("--questions", type=int, default=200)
+    pipeline.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16, 64])
+    pipeline.add_argument("--model-latency", type=float, default=0.05,
+                          help="simulated seconds per model call")
+    pipeline.set_defaults(func=cmd_pipeline)
+
+    prompt = commands.add_parser("prompt", help="prompt size and build time per rendering mode")
+    prompt.add_argument("--tools", nargs="+", type=int, default=[2, 20, 100, 500])
+    prompt.add_argument("--repeat", type=int, default=200)
+    prompt.set_defaults(func=cmd_prompt)
+
+    transport = commands.add_parser("transport", help="JSON-RPC over stdio vs. HTTP per-call overhead")
+    transport.add_argument("--calls", type=int, default=5000)
+    transport.add_argument("--window", type=int, default=32,
+                           help="requests in flight when pipelining, and batch size")
+    transport.add_argument("--rpc-workers", type=int, default=8,
+                           help="--rpc-workers of the stdio server")
+    transport.set_defaults(func=cmd_transport)
+
+    workers = commands.add_parser("workers", help="throughput vs. pre-forked worker processes")
+    workers.add_argument("--workers", nargs="+", type=int, default=[1, 2, 4])
+    workers.add_argument("--size", type=int, default=20_000, help="floats per array argument")
+    workers.add_argument("--clients-per-worker", type=int, default=2)
+    workers.add_argument("--duration", type=float, default=3.0)
+    workers.add_argument("--mode", choices=SERVER_MODES, default="threaded")
+    workers.set_defaults(func=cmd_workers)
+
+    compression = commands.add_parser("compression", help="response size and CPU cost per content coding")
+    compression.add_argument("--tools", nargs="+", type=int, default=[2, 100, 1000],
+                             help="manifest sizes (tool count)")
+    compression.add_argument("--sizes", nargs="+", type=int, default=[10, 1000, 100_000],
+                             help="array result / batch sizes")
+    compression.add_argument("--repeat", type=int, default=3)
+    compression.set_defaults(func=cmd_compression)
+
+    admission = commands.add_parser("admission", help="cost of rate limiting and load shedding")
+    admission.add_argument("--modes", nargs="+", choices=SERVER_MODES, default=["threaded", "async"])
+    admission.add_argument("--clients", type=int, default=8)
+    admission.add_argument("--size", type=int, default=20_000, help="floats per array in the overload cases")
+    admission.add_argument("--overload-clients", type=int, default=32)
+    admission.add_argument("--max-in-flight", type=int, default=4)
+    admission.add_argument("--duration", type=float, default=2.0, help="seconds per case")
+    admission.set_defaults(func=cmd_admission)
+
+    startup = commands.add_parser("startup", help="process start-up time and import-time breakdown")
+    startup.add_argument("--runs", type=int, default=10, help="fresh processes per case")
+    startup.add_argument("--module", default="simple_mcp_client_model",
+                         help="module whose direct imports are broken down")
+    startup.add_argument("--top", type=int, default=15, help="imports listed")
+    startup.set_defaults(func=cmd_startup)
+
+    suite = commands.add_parser("suite", help="all endpoints and hot paths, as JSON, with baseline comparison")
+    suite.add_argument("--url", help="benchmark an already running server instead of starting one")
+    suite.add_argument("--mode", choices=SERVER_MODES, default="threaded")
+    suite.add_argument("--endpoints", nargs="+", choices=list(ENDPOINTS), default=list(ENDPOINTS))
+    suite.add_argument("--concurrency", nargs="+", type=int, default=[1, 8])
+    suite.add_argument("--payload-sizes", nargs="+", type=int, default=[0, 1000],
+                       help="array length of a (0 = scalar call)")
+    suite.add_argument("--reuse", nargs="+", choices=["on", "off"], default=["on", "off"],
+                       help="keep connections open between requests")
+    suite.add_argument("--duration", type=float, default=1.0, help="seconds per case")
+    suite.add_argument("--micro-repeat", type=int, default=5,
+                       help="timing repeats per micro-benchmark (0 skips them)")
+    suite.add_argument("--startup-runs", type=int, default=5,
+                       help="fresh processes per start-up case (0 skips them)")
+    suite.add_argument("--json", help="write results to this file")
+    suite.add_argument("--baseline", help="results of an earlier run to compare against")
+    suite.add_argument("--tolerance", type=float, default=0.15,
+                       help="relative slowdown reported as a regression")
+    suite.set_defaults(func=cmd_suite)
+
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    sys.exit(args.func(args))
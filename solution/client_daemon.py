@@ -0,0 +1,95 @@
+"""
+Warm, long-lived MCP client process that other processes hand questions to.
+
+Started once with `simple_mcp_client_model.py --serve-daemon PATH`, the
+daemon keeps everything that is slow to set up: imported modules, the model
+client, pooled HTTP connections, the discovered tool manifest and the
+routing cache. A short-lived CLI run with `--daemon PATH` then only pays for
+a Unix socket round trip instead of a cold start.
+
+Protocol: newline-delimited JSON over a Unix stream socket. Each request line
+is {"questions": [...]} and gets one response line {"records": [...]} (one
+record per question, as answer_question returns them) or {"error": "..."}.
+A connection may carry any number of requests.
+
+Standard library only, so the sending side starts fast.
+"""
+
+import json
+import os
+import socket
+import socketserver
+import stat
+
+
+class _DaemonHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                questions = request["questions"]
+                if not isinstance(questions, list) or not all(isinstance(q, str) for q in questions):
+                    raise ValueError("questions must be a list of strings")
+                response = {"records": self.server.answer_questions(questions)}
+            except (ValueError, KeyError, TypeError) as e:
+                response = {"error": f"bad request: {e}"}
+            except Exception as e:  # keep serving other clients
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Answers questions from local clients with `answer_questions(list) -> list`"""
+
+    daemon_threads = True
+
+    def __init__(self, path, answer_questions):
+        self.answer_questions = answer_questions
+        _remove_stale_socket(path)
+        super().__init__(path, _DaemonHandler)
+        os.chmod(path, 0o600)  # the daemon acts with this user's credentials
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except OSError:
+            pass
+
+
+def _remove_stale_socket(path):
+    """Remove a socket file left behind by a daemon that is no longer running"""
+    try:
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise FileExistsError(f"{path} exists and is not a socket")
+    except FileNotFoundError:
+        return
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    raise OSError(f"a daemon is already listening on {path}")
+
+
+def ask(path, questions, timeout=None):
+    """
+    Answer `questions` with the daemon listening on `path`. Raises OSError
+    when no daemon is running there, RuntimeError if it rejects the request.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(path)
+        sock.sendall(json.dumps({"questions": list(questions)}).encode() + b"\n")
+        with sock.makefile("rb") as reader:
+            line = reader.readline()
+    if not line:
+        raise ConnectionError(f"daemon on {path} closed the connection")
+    response = json.loads(line)
+    if "error" in response:
+        raise RuntimeError(response["error"])
+    return response["records"]
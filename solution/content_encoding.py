@@ -0,0 +1,91 @@
+"""
+HTTP response compression (Content-Encoding) for the simple MCP server.
+
+gzip is always available; zstd (Python 3.14's compression.zstd or the
+`zstandard` package) and brotli (the `brotli` package) are used when
+installed. negotiate() picks one from a request's Accept-Encoding header,
+preferring the client's q-values and then the order of CODECS (best ratio
+for the CPU spent first). Levels are moderate on purpose: responses are
+compressed on the request path, so speed matters more than the last
+few percent of size.
+"""
+
+import gzip
+
+try:
+    from compression import zstd as _zstd  # Python 3.14+
+except ImportError:
+    _zstd = None
+    try:
+        import zstandard
+    except ImportError:  # optional
+        zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional
+    brotli = None
+
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 4
+
+# coding -> (compress, decompress), in order of preference
+CODECS = {}
+if _zstd is not None:
+    CODECS["zstd"] = (lambda data: _zstd.compress(data, level=ZSTD_LEVEL), _zstd.decompress)
+elif zstandard is not None:
+    _zstd_compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+    CODECS["zstd"] = (_zstd_compressor.compress, lambda data: zstandard.ZstdDecompressor().decompress(data))
+if brotli is not None:
+    CODECS["br"] = (lambda data: brotli.compress(data, quality=BROTLI_QUALITY), brotli.decompress)
+CODECS["gzip"] = (lambda data: gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0), gzip.decompress)
+
+
+def _accepted(accept_encoding):
+    """coding -> q from an Accept-Encoding header"""
+    accepted = {}
+    for part in accept_encoding.split(","):
+        coding, *params = part.split(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def negotiate(accept_encoding):
+    """The coding to compress a response with, or None to send it as is"""
+    if not accept_encoding:
+        return None
+    accepted = _accepted(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in CODECS:
+        q = accepted.get(coding, accepted.get("x-gzip", wildcard) if coding == "gzip" else wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(data, coding):
+    return CODECS[coding][0](data)
+
+
+def decompress(data, coding):
+    """Undo compress(); raises ValueError for an unknown coding or bad data"""
+    codec = CODECS.get(coding)
+    if codec is None:
+        raise ValueError(f"unsupported content coding: {coding!r}")
+    try:
+        return codec[1](data)
+    except Exception as e:  # each codec has its own error types
+        raise ValueError(f"invalid {coding} data: {e}") from None
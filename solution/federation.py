@@ -0,0 +1,149 @@
+"""
+Tool federation across several MCP servers for the client.
+
+Servers are configured as a list of URLs, each optionally named:
+"math=http://10.0.0.1:8000,math=http://10.0.0.2:8000,http://10.0.0.3:8000".
+Servers sharing a name are replicas of one another; an unnamed server is
+named after its host and port.
+
+- Discovery fetches every server's manifest in parallel, so it takes about
+  as long as the slowest server rather than the sum of all of them
+- The manifests are merged into one tool index. A tool that every server
+  advertising it defines identically keeps its plain name, and calls to it
+  are spread over all those servers. Where definitions differ, each server
+  name's version is listed as "<server name>.<tool>" instead. The
+  "<server name>.<tool>" form always works, e.g. to pin a call to one
+  replica set.
+- Each call goes to the candidate with the fewest requests in flight
+  (least outstanding requests), preferring servers whose circuit is closed
+"""
+
+import json
+import random
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+from resilience import CircuitBreaker
+
+SEPARATOR = "."
+_UNSAFE = re.compile(r"[^A-Za-z0-9_-]+")
+
+
+class Server:
+    """One MCP server: its manifest, requests in flight and circuit breaker"""
+
+    def __init__(self, url, name=None, breaker=None):
+        self.url = url.rstrip("/")
+        parsed = urlparse(self.url)
+        self.name = name or _UNSAFE.sub("_", parsed.netloc or self.url).strip("_")
+        self.breaker = breaker or CircuitBreaker()
+        self.tools = None  # last manifest fetched (None until the first success)
+        self.etag = None
+        self.outstanding = 0
+
+    def __repr__(self):
+        return f"Server({self.name!r}, {self.url!r}, outstanding={self.outstanding})"
+
+
+def parse_servers(spec, breaker_factory=None):
+    """Servers from "url,name=url,..." (None or "" -> [])"""
+    servers = []
+    for entry in filter(None, (part.strip() for part in (spec or "").split(","))):
+        name, _, url = entry.partition("=") if "=" in entry.split("://", 1)[0] else ("", "", entry)
+        servers.append(Server(url, name or None, breaker_factory() if breaker_factory else None))
+    return servers
+
+
+class Federation:
+    """Merged tool index over `servers`, with least-outstanding-requests routing"""
+
+    def __init__(self, servers):
+        if not servers:
+            raise ValueError("federation needs at least one server")
+        self.servers = servers
+        self.tools = []  # merged, as listed to the model
+        self._routes = {}  # tool name as listed -> (remote name, [Server, ...])
+        self._lock = threading.Lock()
+        self._random = random.Random()
+
+    def discover(self, fetch):
+        """
+        Refresh every server's manifest in parallel and rebuild the index.
+        `fetch(server)` returns (tools, etag), or None if unchanged (304), and
+        raises on failure; a failed server keeps its last known manifest.
+        Returns {server: exception} for the servers that failed.
+        """
+        def refresh(server):
+            try:
+                fetched = fetch(server)
+            except Exception as e:
+                return e
+            if fetched is not None:
+                server.tools, server.etag = fetched
+            return None
+
+        with ThreadPoolExecutor(max_workers=len(self.servers), thread_name_prefix="mcp-discover") as pool:
+            errors = dict(zip(self.servers, pool.map(refresh, self.servers)))
+        self._rebuild()
+        return {server: error for server, error in errors.items() if error is not None}
+
+    def _rebuild(self):
+        by_name = {}  # remote tool name -> [(Server, definition), ...]
+        for server in self.servers:
+            for tool in server.tools or ():
+                by_name.setdefault(tool["name"], []).append((server, tool))
+        tools, routes = [], {}
+        for name, entries in by_name.items():
+            for server, tool in entries:
+                qualified = f"{server.name}{SEPARATOR}{name}"
+                routes.setdefault(qualified, (name, []))[1].append(server)
+            definitions = {json.dumps(tool, sort_keys=True) for _, tool in entries}
+            if len(definitions) == 1:
+                routes[name] = (name, [server for server, _ in entries])
+                tools.append(entries[0][1])
+                continue
+            # Same name, different tools: list each server name's version
+            listed = set()
+            for server, tool in entries:
+                qualified = f"{server.name}{SEPARATOR}{name}"
+                if qualified not in listed:
+                    listed.add(qualified)
+                    tools.append({**tool, "name": qualified})
+        with self._lock:
+            self.tools, self._routes = tools, routes
+
+    def candidates(self, tool_name):
+        """(remote tool name, servers offering it); KeyError if none do"""
+        with self._lock:
+            return self._routes[tool_name]
+
+    @contextmanager
+    def route(self, tool_name):
+        """
+        Pick the server for one call to `tool_name` and count the call as in
+        flight there while the block runs. Yields (server, remote tool name):
+        the candidate with the fewest requests in flight, ties broken at
+        random; server is None if no server offers the tool.
+        """
+        with self._lock:
+            route = self._routes.get(tool_name)
+            if route is None:
+                server = None
+            else:
+                remote_name, servers = route
+                healthy = [server for server in servers if server.breaker.state == CircuitBreaker.CLOSED]
+                pool = healthy or servers
+                least = min(server.outstanding for server in pool)
+                server = self._random.choice([s for s in pool if s.outstanding == least])
+                server.outstanding += 1
+        if server is None:
+            yield None, tool_name
+            return
+        try:
+            yield server, remote_name
+        finally:
+            with self._lock:
+                server.outstanding -= 1
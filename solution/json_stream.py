@@ -0,0 +1,93 @@
+"""
+Incremental JSON helpers for streaming request bodies.
+
+iter_json_array() turns a stream of byte chunks holding one JSON array into
+its elements, yielding each as soon as it has arrived, so a large batch can
+be executed while it is still being uploaded and only one element (plus one
+chunk) is held in memory at a time.
+"""
+
+import codecs
+import json
+import re
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+def iter_json_array(chunks):
+    """
+    Yield the elements of the JSON array spread across `chunks` (bytes).
+    Raises ValueError if the input is not a well-formed JSON array.
+    """
+    chunks = iter(chunks)
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    pos = 0
+    exhausted = False
+
+    def fill(min_size=0):
+        # Drop what's been consumed, then read until the buffer holds at
+        # least `min_size` characters (or one more chunk) or input ends.
+        nonlocal buffer, pos, exhausted
+        buffer = buffer[pos:]
+        pos = 0
+        target = max(min_size, len(buffer) + 1)
+        while len(buffer) < target and not exhausted:
+            chunk = next(chunks, None)
+            if chunk is None:
+                exhausted = True
+                buffer += utf8.decode(b"", final=True)
+            else:
+                buffer += utf8.decode(chunk)
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer) or exhausted:
+                return
+            fill()
+
+    def next_char():
+        nonlocal pos
+        skip_whitespace()
+        if pos >= len(buffer):
+            raise ValueError("unexpected end of JSON array")
+        char = buffer[pos]
+        pos += 1
+        return char
+
+    if next_char() != "[":
+        raise ValueError("expected a JSON array")
+    skip_whitespace()
+    if buffer.startswith("]", pos):
+        pos += 1
+    else:
+        while True:
+            # An element is complete once raw_decode succeeds and a ',' or ']'
+            # follows it (a number like "12" could continue as "12.5"). On a
+            # miss, double the buffer so large elements parse in linear time.
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    follow = _WHITESPACE.match(buffer, end).end()
+                    if exhausted or (follow < len(buffer) and buffer[follow] in ",]"):
+                        break
+                except json.JSONDecodeError as e:
+                    if exhausted:
+                        raise ValueError(f"invalid JSON array element: {e}") from None
+                fill(2 * (len(buffer) - pos))
+            pos = end
+            yield value
+
+            separator = next_char()
+            if separator == "]":
+                break
+            if separator != ",":
+                raise ValueError(f"expected ',' or ']' in JSON array, got {separator!r}")
+            skip_whitespace()
+
+    skip_whitespace()
+    if pos < len(buffer):
+        raise ValueError("unexpected data after JSON array")
@@ -0,0 +1,336 @@
+"""
+JSON-RPC 2.0 over stdio for the simple MCP server, and a matching client.
+
+This is how real MCP hosts talk to local servers: the host launches the
+server as a subprocess and exchanges newline-delimited JSON-RPC messages on
+its stdin/stdout, with no TCP connection or HTTP headers to parse.
+
+- RPCDispatcher answers `initialize`, `ping`, `tools/list` and `tools/call`
+  (single messages or batches) from the same ToolRegistry as MCPHandler
+- serve_stdio() runs it on stdin/stdout; requests are handled concurrently,
+  so a client can pipeline many of them and match responses by id
+- StdioClient launches a server command and sends requests to it, returning
+  a Future per request
+"""
+
+import itertools
+import json
+import shlex
+import subprocess
+import sys
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from serialization import json_dumps
+from tool_registry import ToolError, utc_timestamp
+
+PROTOCOL_VERSION = "2024-11-05"
+SERVER_INFO = {"name": "simple-mcp-server", "version": "1.0.0"}
+
+# Standard JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+SERVER_OVERLOADED = -32000  # implementation-defined server error range
+
+
+class JSONRPCError(Exception):
+    """A JSON-RPC error response (raised by handlers, or received by the client)"""
+
+    def __init__(self, code, message, data=None):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+        self.data = data
+
+    def to_dict(self):
+        error = {"code": self.code, "message": self.message}
+        if self.data is not None:
+            error["data"] = self.data
+        return error
+
+
+def _error_response(request_id, error):
+    return {"jsonrpc": "2.0", "id": request_id, "error": error.to_dict()}
+
+
+class RPCDispatcher:
+    """MCP methods over a ToolRegistry, for any JSON-RPC transport"""
+
+    def __init__(self, registry):
+        self.registry = registry
+        self.methods = {
+            "initialize": self.initialize,
+            "ping": lambda params: {},
+            "tools/list": self.list_tools,
+            "tools/call": self.call_tool,
+        }
+        self._tools_list = (None, None)  # (manifest, tools/list result)
+
+    def initialize(self, params):
+        return {
+            "protocolVersion": PROTOCOL_VERSION,
+            "capabilities": {"tools": {"listChanged": False}},
+            "serverInfo": SERVER_INFO,
+        }
+
+    def list_tools(self, params):
+        manifest, result = self._tools_list
+        if manifest is not self.registry.manifest:
+            manifest = self.registry.manifest
+            result = {"tools": [self._list_entry(tool) for tool in manifest.tools]}
+            self._tools_list = (manifest, result)
+        return result
+
+    @staticmethod
+    def _list_entry(tool):
+        entry = {"name": tool["name"], "description": tool["description"], "inputSchema": tool["parameters"]}
+        if "annotations" in tool:
+            entry["annotations"] = tool["annotations"]
+        return entry
+
+    def call_tool(self, params):
+        if not isinstance(params, dict) or not isinstance(params.get("name"), str):
+            raise JSONRPCError(INVALID_PARAMS, "tools/call needs a tool name")
+        name = params["name"]
+        if name not in self.registry:
+            raise JSONRPCError(INVALID_PARAMS, f"Unknown tool: {name}")
+        try:
+            value, encoded = self.registry.evaluate(name, params.get("arguments") or {})
+        except ToolError as e:
+            if e.status >= 500:
+                # Overload / timeout: the caller should back off, not the model
+                raise JSONRPCError(SERVER_OVERLOADED, e.message,
+                                   {"status": e.status, "retry_after": e.retry_after}) from None
+            # Failed calls are results (isError), so a model can see what went wrong
+            return {"content": [{"type": "text", "text": e.message}], "isError": True}
+        return {
+            "content": [{"type": "text", "text": encoded.decode()}],
+            "structuredContent": {"result": value, "timestamp": utc_timestamp()},
+            "isError": False,
+        }
+
+    def handle(self, message):
+        """The response to one request object, or None for a notification"""
+        if not isinstance(message, dict) or message.get("jsonrpc") != "2.0" \
+                or not isinstance(message.get("method"), str):
+            return _error_response(message.get("id") if isinstance(message, dict) else None,
+                                   JSONRPCError(INVALID_REQUEST, "Invalid Request"))
+        request_id = message.get("id")
+        is_notification = "id" not in message
+        method = self.methods.get(message["method"])
+        try:
+            if method is None:
+                raise JSONRPCError(METHOD_NOT_FOUND, f"Method not found: {message['method']}")
+            result = method(message.get("params"))
+        except JSONRPCError as e:
+            return None if is_notification else _error_response(request_id, e)
+        except Exception as e:
+            return None if is_notification else _error_response(
+                request_id, JSONRPCError(INTERNAL_ERROR, f"Internal error: {e}"))
+        if is_notification:
+            return None
+        return {"jsonrpc": "2.0", "id": request_id, "result": result}
+
+    def handle_line(self, line):
+        """Response bytes (one line, no newline) for one message line, or None"""
+        try:
+            message = json.loads(line)
+        except ValueError:
+            response = _error_response(None, JSONRPCError(PARSE_ERROR, "Parse error"))
+        else:
+            if isinstance(message, list):
+                if not message:
+                    response = _error_response(None, JSONRPCError(INVALID_REQUEST, "Empty batch"))
+                else:
+                    response = [r for r in map(self.handle, message) if r is not None] or None
+            else:
+                response = self.handle(message)
+        if response is None:
+            return None
+        return json_dumps(response)
+
+
+def serve_stdio(dispatcher, stdin=None, stdout=None, workers=8):
+    """
+    Serve newline-delimited JSON-RPC on stdin/stdout until stdin closes.
+    With workers > 0, messages are handled on a thread pool, so responses
+    to pipelined requests can come back out of order (match them by id).
+    """
+    stdin = stdin or sys.stdin.buffer
+    stdout = stdout or sys.stdout.buffer
+    write_lock = threading.Lock()
+
+    def respond(line):
+        data = dispatcher.handle_line(line)
+        if data is not None:
+            with write_lock:
+                stdout.write(data + b"\n")
+                stdout.flush()
+
+    if workers <= 0:
+        for line in stdin:
+            if line.strip():
+                respond(line)
+        return
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-rpc") as pool:
+        for line in stdin:
+            if line.strip():
+                pool.submit(respond, line)
+
+
+class StdioClient:
+    """
+    JSON-RPC client for a server launched as a subprocess. Thread-safe:
+    any number of requests can be in flight at once; a reader thread
+    resolves each one's Future when its response arrives. `timeout` is the
+    default number of seconds call() waits for a response (None: no limit).
+    """
+
+    def __init__(self, command, cwd=None, timeout=None):
+        if isinstance(command, str):
+            command = shlex.split(command)
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        cwd=cwd, bufsize=0)
+        self.timeout = timeout
+        self._ids = itertools.count(1)
+        self._pending = {}  # request id -> Future
+        self._lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_responses, daemon=True)
+        self._reader.start()
+
+    def _send(self, payload):
+        data = json_dumps(payload) + b"\n"
+        with self._lock:
+            if self._closed:
+                raise ConnectionError("stdio server is closed")
+            self.process.stdin.write(data)
+
+    def _new_request(self, method, params):
+        request_id = next(self._ids)
+        future = Future()
+        with self._lock:
+            self._pending[request_id] = future
+        message = {"jsonrpc": "2.0", "id": request_id, "method": method}
+        if params is not None:
+            message["params"] = params
+        return message, future
+
+    def request(self, method, params=None):
+        """Send a request without waiting; returns a Future of its result"""
+        message, future = self._new_request(method, params)
+        self._send(message)
+        return future
+
+    def batch(self, requests):
+        """Send [(method, params), ...] as one JSON-RPC batch; returns Futures"""
+        if not requests:
+            return []  # an empty batch is an invalid request in JSON-RPC
+        messages, futures = zip(*(self._new_request(method, params) for method, params in requests))
+        self._send(list(messages))
+        return list(futures)
+
+    def discard(self, futures):
+        """Stop waiting for `futures` (from request/batch): late answers are dropped"""
+        futures = set(futures)
+        with self._lock:
+            for request_id in [i for i, f in self._pending.items() if f in futures]:
+                del self._pending[request_id]
+
+    def notify(self, method, params=None):
+        message = {"jsonrpc": "2.0", "method": method}
+        if params is not None:
+            message["params"] = params
+        self._send(message)
+
+    def call(self, method, params=None, timeout=None):
+        """
+        Send a request and wait for its result, at most `timeout` seconds
+        (default: the client's timeout). Raises JSONRPCError, or TimeoutError
+        if the server hasn't answered in time (a late answer is dropped).
+        """
+        message, future = self._new_request(method, params)
+        self._send(message)
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(message["id"], None)
+            raise TimeoutError(f"{method}: no response from the stdio server within {timeout:g}s") from None
+
+    def _read_responses(self):
+        for line in self.process.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            for response in (message if isinstance(message, list) else [message]):
+                with self._lock:
+                    future = self._pending.pop(response.get("id"), None)
+                if future is None:
+                    continue
+                if "error" in response:
+                    error = response["error"]
+                    future.set_exception(JSONRPCError(error.get("code"), error.get("message"),
+                                                      error.get("data")))
+                else:
+                    future.set_result(response.get("result"))
+        with self._lock:
+            self._closed = True
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("stdio server exited"))
+
+    def initialize(self, client_name="simple-mcp-client"):
+        result = self.call("initialize", {"protocolVersion": PROTOCOL_VERSION, "capabilities": {},
+                                          "clientInfo": {"name": client_name, "version": "1.0.0"}})
+        self.notify("notifications/initialized")
+        return result
+
+    def list_tools(self):
+        """Tool definitions in the /_mcp/tools format (parameters = inputSchema)"""
+        tools = []
+        for entry in self.call("tools/list")["tools"]:
+            tool = {"name": entry["name"], "description": entry.get("description", ""),
+                    "parameters": entry.get("inputSchema", {})}
+            if "annotations" in entry:
+                tool["annotations"] = entry["annotations"]
+            tools.append(tool)
+        return tools
+
+    @staticmethod
+    def tool_result(result):
+        """A tools/call result as the HTTP routes report it: {"result", "timestamp"} or {"error"}"""
+        if result.get("isError"):
+            return {"error": " ".join(c.get("text", "") for c in result.get("content", []))}
+        if "structuredContent" in result:
+            return result["structuredContent"]
+        return {"result": json.loads(result["content"][0]["text"])}
+
+    def call_tool(self, name, arguments, timeout=None):
+        return self.tool_result(self.call("tools/call", {"name": name, "arguments": arguments}, timeout))
+
+    def close(self, timeout=5):
+        with self._lock:
+            self._closed = True
+            try:
+                self.process.stdin.close()
+            except OSError:
+                pass
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self._reader.join(timeout)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,278 @@
+"""
+Request metrics for the simple MCP server, in Prometheus text format.
+
+Counters are kept per thread (each handler thread gets its own shard on
+first use), so recording a request is a few dict/list updates with no lock
+on the hot path. Scraping sums the shards into a snapshot, a plain dict
+that can also be merged with snapshots from other processes (see
+SnapshotExchange, used by the pre-forked multi-process mode).
+"""
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# Latency histogram buckets, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+PHASES = ("parse", "dispatch", "serialize")
+
+
+class _Shard:
+    """One thread's counters"""
+
+    __slots__ = ("requests", "errors", "in_flight", "histograms")
+
+    def __init__(self):
+        self.requests = {}    # (route, status) -> count
+        self.errors = {}      # route -> count
+        self.in_flight = 0
+        self.histograms = {}  # (route, phase) -> [bucket counts..., sum, count]
+
+
+class Metrics:
+    """Per-route request counts, errors, in-flight requests and latencies"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = _Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    def request_started(self):
+        self._shard().in_flight += 1
+
+    def request_finished(self, route, status, duration, phases=None):
+        """Record a finished request; `phases` maps phase name -> seconds"""
+        shard = self._shard()
+        shard.in_flight -= 1
+        if status is None:
+            return
+        key = (route, status)
+        shard.requests[key] = shard.requests.get(key, 0) + 1
+        if status >= 400:
+            shard.errors[route] = shard.errors.get(route, 0) + 1
+        self._observe(shard, route, "total", duration)
+        if phases:
+            for phase, seconds in phases.items():
+                self._observe(shard, route, phase, seconds)
+
+    @staticmethod
+    def _observe(shard, route, phase, seconds):
+        histogram = shard.histograms.get((route, phase))
+        if histogram is None:
+            histogram = shard.histograms[(route, phase)] = [0] * (len(BUCKETS) + 3)
+        histogram[bisect_left(BUCKETS, seconds)] += 1
+        histogram[-2] += seconds
+        histogram[-1] += 1
+
+    def snapshot(self):
+        """All shards summed into one JSON-friendly dict"""
+        with self._shards_lock:
+            shards = list(self._shards)
+        snapshot = _empty_snapshot()
+        for shard in shards:
+            merge_snapshots(snapshot, {
+                "requests": {f"{route}\t{status}": n for (route, status), n in list(shard.requests.items())},
+                "errors": dict(shard.errors),
+                "in_flight": shard.in_flight,
+                "histograms": {f"{route}\t{phase}": list(h) for (route, phase), h in list(shard.histograms.items())},
+            })
+        return snapshot
+
+
+def merge_snapshots(into, other):
+    """Add snapshot `other` into `into` (e.g. to combine worker processes)"""
+    for name in ("requests", "errors"):
+        for key, count in other[name].items():
+            into[name][key] = into[name].get(key, 0) + count
+    into["in_flight"] += other["in_flight"]
+    for key, histogram in other["histograms"].items():
+        mine = into["histograms"].get(key)
+        if mine is None:
+            into["histograms"][key] = list(histogram)
+        else:
+            for i, value in enumerate(histogram):
+                mine[i] += value
+    return into
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels.items()) + "}"
+
+
+def render(snapshot, result_cache_stats=None):
+    """Prometheus text exposition of a snapshot (plus result cache stats)"""
+    lines = [
+        "# HELP mcp_requests_total Requests handled, by route and status code.",
+        "# TYPE mcp_requests_total counter",
+    ]
+    for key, count in sorted(snapshot["requests"].items()):
+        route, status = key.split("\t")
+        lines.append(f"mcp_requests_total{_labels(route=route, status=status)} {count}")
+
+    lines += [
+        "# HELP mcp_request_errors_total Requests answered with a 4xx/5xx status, by route.",
+        "# TYPE mcp_request_errors_total counter",
+    ]
+    for route, count in sorted(snapshot["errors"].items()):
+        lines.append(f"mcp_request_errors_total{_labels(route=route)} {count}")
+
+    lines += [
+        "# HELP mcp_requests_in_flight Requests currently being handled.",
+        "# TYPE mcp_requests_in_flight gauge",
+        f"mcp_requests_in_flight {snapshot['in_flight']}",
+        "# HELP mcp_request_duration_seconds Request latency by route and phase "
+        "(parse, dispatch, serialize, or total).",
+        "# TYPE mcp_request_duration_seconds histogram",
+    ]
+    for key, histogram in sorted(snapshot["histograms"].items()):
+        route, phase = key.split("\t")
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ("+Inf",), histogram[:-2]):
+            cumulative += count
+            lines.append(f"mcp_request_duration_seconds_bucket"
+                         f"{_labels(route=route, phase=phase, le=bound)} {cumulative}")
+        lines.append(f"mcp_request_duration_seconds_sum{_labels(route=route, phase=phase)} {histogram[-2]:.6f}")
+        lines.append(f"mcp_request_duration_seconds_count{_labels(route=route, phase=phase)} {histogram[-1]}")
+
+    if result_cache_stats is not None:
+        lines += [
+            "# HELP mcp_result_cache_lookups_total Result cache lookups for deterministic tools.",
+            "# TYPE mcp_result_cache_lookups_total counter",
+        ]
+        for tool, counts in sorted(result_cache_stats["tools"].items()):
+            lines.append(f"mcp_result_cache_lookups_total{_labels(tool=tool, outcome='hit')} {counts['hits']}")
+            lines.append(f"mcp_result_cache_lookups_total{_labels(tool=tool, outcome='miss')} {counts['misses']}")
+        lines += [
+            "# HELP mcp_result_cache_entries Results currently memoized.",
+            "# TYPE mcp_result_cache_entries gauge",
+            f"mcp_result_cache_entries {result_cache_stats['entries']}",
+            "# HELP mcp_result_cache_bytes Encoded size of memoized results.",
+            "# TYPE mcp_result_cache_bytes gauge",
+            f"mcp_result_cache_bytes {result_cache_stats['bytes']}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def merge_cache_stats(into, other):
+    """Add result cache stats `other` into `into` (see ResultCache.stats)"""
+    for name in ("entries", "bytes", "max_entries", "max_bytes"):
+        into[name] = into.get(name, 0) + other.get(name, 0)
+    tools = into.setdefault("tools", {})
+    for tool, counts in other.get("tools", {}).items():
+        mine = tools.setdefault(tool, {"hits": 0, "misses": 0, "evictions": 0})
+        for name in ("hits", "misses", "evictions"):
+            mine[name] += counts.get(name, 0)
+    return into
+
+
+def _empty_snapshot():
+    return {"requests": {}, "errors": {}, "in_flight": 0, "histograms": {}}
+
+
+class SnapshotExchange:
+    """
+    Shares metrics between the worker processes of a pre-forked server
+    through a directory: each worker publishes its snapshot and result cache
+    stats to <directory>/<name>.json every `interval` seconds, and a scrape on
+    any worker adds up every file (its own live numbers replacing its file).
+    The files double as worker heartbeats. Counts of workers that exited are
+    folded into retired.json, so totals survive restarts.
+    """
+
+    RETIRED = "retired"
+
+    def __init__(self, directory, name, interval=1.0):
+        self.directory = directory
+        self.name = name
+        self.interval = interval
+
+    @staticmethod
+    def path(directory, name):
+        return os.path.join(directory, f"{name}.json")
+
+    @staticmethod
+    def _write(path, payload):
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _read(path):
+        try:
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def publish(self, snapshot, cache_stats):
+        self._write(self.path(self.directory, self.name),
+                    {"metrics": snapshot, "result_cache": cache_stats})
+
+    def start(self, source):
+        """Publish source() -> (snapshot, cache_stats) now and then every interval"""
+        self.publish(*source())
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self.publish(*source())
+                except OSError:
+                    pass  # directory removed: the server is shutting down
+
+        threading.Thread(target=loop, name="mcp-metrics-publisher", daemon=True).start()
+
+    def aggregate(self, snapshot, cache_stats):
+        """(snapshot, cache stats) summed over this worker and all the others"""
+        total = merge_snapshots(_empty_snapshot(), snapshot)
+        total_cache = merge_cache_stats({}, cache_stats)
+        own = f"{self.name}.json"
+        for filename in sorted(os.listdir(self.directory)):
+            if filename == own or not filename.endswith(".json"):
+                continue
+            payload = self._read(os.path.join(self.directory, filename))
+            if payload is not None:
+                merge_snapshots(total, payload["metrics"])
+                merge_cache_stats(total_cache, payload["result_cache"])
+        for counts in total_cache["tools"].values():
+            lookups = counts["hits"] + counts["misses"]
+            counts["hit_rate"] = round(counts["hits"] / lookups, 4) if lookups else 0.0
+        return total, total_cache
+
+    @classmethod
+    def last_published(cls, directory, name):
+        """When worker `name` last published (its heartbeat), or None"""
+        try:
+            return os.path.getmtime(cls.path(directory, name))
+        except OSError:
+            return None
+
+    @classmethod
+    def retire(cls, directory, name):
+        """Fold the last snapshot of an exited worker into retired.json"""
+        path = cls.path(directory, name)
+        payload = cls._read(path)
+        if payload is None:
+            return
+        retired_path = cls.path(directory, cls.RETIRED)
+        retired = cls._read(retired_path) or {"metrics": _empty_snapshot(), "result_cache": {}}
+        payload["metrics"]["in_flight"] = 0
+        merge_snapshots(retired["metrics"], payload["metrics"])
+        # Only the lookup counters carry over; the cache itself died with the worker
+        cache_stats = payload["result_cache"]
+        merge_cache_stats(retired["result_cache"], {"tools": cache_stats.get("tools", {})})
+        cls._write(retired_path, retired)
+        os.remove(path)
@@ -0,0 +1,130 @@
+"""
+Model backends for the MCP client.
+
+The client only needs one thing from a model: given the router prompt built
+by build_dynamic_prompt, return the JSON decision text. A backend is any
+object with a complete(prompt) -> str method:
+
+- GroqBackend: the real model, through the Groq API
+- MockBackend: a local rule-based router that answers in the same JSON
+  format after a configurable simulated latency, so the client + server
+  pipeline can be tested and benchmarked offline
+"""
+
+import json
+import random
+import re
+import time
+from abc import ABC, abstractmethod
+
+DEFAULT_GROQ_MODEL = "llama3-8b-8192"
+
+
+class ModelBackend(ABC):
+    """
+    Interface: turn a router prompt into the model's raw reply. A subclass
+    without complete() can't be instantiated, so it fails when created
+    rather than on the first question.
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def complete(self, prompt: str) -> str:
+        """The model's raw reply (JSON decision text) to `prompt`"""
+
+
+class GroqBackend(ModelBackend):
+    """Routes with a Groq-hosted model (needs GROQ_API_KEY and network)"""
+
+    name = "groq"
+
+    def __init__(self, api_key=None, model=DEFAULT_GROQ_MODEL):
+        from groq import Groq  # only needed when this backend is actually used
+        self.client = Groq(api_key=api_key)
+        self.model = model
+
+    def complete(self, prompt: str) -> str:
+        chat_completion = self.client.chat.completions.create(
+            messages=[{"role": "user", "content": prompt}],
+            model=self.model,
+        )
+        return chat_completion.choices[0].message.content
+
+
+class MockBackend(ModelBackend):
+    """
+    Deterministic stand-in for the model. Picks a tool by keyword from the
+    query in the prompt, takes the first two numbers as a and b, and sleeps
+    `latency` seconds (plus up to `jitter`) to imitate a model round trip.
+    A query chained with "then" ("add 2 and 3 then subtract 1") becomes a
+    plan, a clause with a single number applying it to the previous result.
+    """
+
+    name = "mock"
+
+    # Keywords -> tool name, checked in order; only tools the prompt lists are used
+    RULES = [
+        (re.compile(r"\b(subtract|substract|minus|difference|take away)\b|\s-\s"), "substract"),
+        (re.compile(r"\b(add|plus|sum|total)\b|\+"), "add"),
+    ]
+    QUERY = re.compile(r'Query: "(.*)"\s*$', re.DOTALL)
+    TOOL_LINE = re.compile(r"^\d+\. ([^:\s(]+)", re.MULTILINE)
+    NUMBER = re.compile(r"-?\d+(?:\.\d+)?")
+    THEN = re.compile(r"[,;]?\s*\b(?:and\s+)?then\b\s*")
+
+    def __init__(self, latency=0.0, jitter=0.0, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def decide(self, prompt: str) -> dict:
+        """The routing decision for `prompt`, as a dict"""
+        match = self.QUERY.search(prompt)
+        question = (match.group(1) if match else prompt).lower()
+        available = set(self.TOOL_LINE.findall(prompt))
+
+        clauses = [clause for clause in self.THEN.split(question) if clause.strip()]
+        if len(clauses) > 1:
+            plan = []
+            for i, clause in enumerate(clauses, 1):
+                step = self._call(clause, available, previous=plan[-1]["id"] if plan else None)
+                if step is None:
+                    break
+                plan.append({"id": f"s{i}", **step})
+            else:
+                return {"tool_use": True, "plan": plan}
+
+        step = self._call(question, available)
+        return {"tool_use": True, **step} if step else {"tool_use": False}
+
+    def _call(self, text, available, previous=None):
+        """{"tool_name", "parameters"} for one clause, or None if no rule fits"""
+        numbers = [float(n) if "." in n else int(n) for n in self.NUMBER.findall(text)]
+        if len(numbers) < 2 and previous and numbers:
+            numbers = [f"${previous}", numbers[0]]
+        for pattern, tool_name in self.RULES:
+            if tool_name in available and pattern.search(text) and len(numbers) >= 2:
+                return {"tool_name": tool_name, "parameters": {"a": numbers[0], "b": numbers[1]}}
+        return None
+
+    def complete(self, prompt: str) -> str:
+        delay = self.latency + (self._random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        return json.dumps(self.decide(prompt), indent=4)
+
+
+BACKENDS = {
+    GroqBackend.name: GroqBackend,
+    MockBackend.name: MockBackend,
+}
+
+
+def create_backend(name, **options):
+    """Build a backend by name ("groq" or "mock") with its options"""
+    try:
+        backend_class = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown model backend: {name!r} (expected one of {sorted(BACKENDS)})") from None
+    return backend_class(**options)
@@ -0,0 +1,184 @@
+"""
+Pre-forked multi-process mode for the simple MCP server.
+
+One Python process is limited by the GIL: tool work and JSON encoding in
+MCPHandler use at most one core however many threads serve requests.
+PreforkServer opens the listening socket once, then forks `workers` child
+processes that all accept from it (the kernel hands each connection to one
+of them). The parent only supervises:
+
+- a worker that exits, or stops publishing its heartbeat, is restarted
+  (with a growing delay if it keeps crashing at startup)
+- Ctrl+C / SIGTERM stops the workers gracefully: they stop accepting, finish
+  the requests in progress (up to `grace` seconds) and exit
+- workers share their metrics through a SnapshotExchange directory, so
+  /_mcp/metrics on any worker reports totals for the whole server
+
+POSIX only (it needs os.fork).
+"""
+
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+
+from metrics import SnapshotExchange
+
+POLL_INTERVAL = 0.2
+MAX_RESTART_DELAY = 30.0
+
+
+class PreforkServer:
+    """
+    Supervises `workers` processes serving `sock`. `make_worker(sock,
+    exchange)` runs in each child and returns the server to run there (e.g.
+    from make_server(..., sock=sock)), wired to publish through `exchange`.
+    """
+
+    def __init__(self, sock, workers, make_worker, grace=10.0, health_timeout=10.0):
+        if not hasattr(os, "fork"):
+            raise RuntimeError("multi-process mode needs os.fork (not available on this platform)")
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self.workers = workers
+        self.make_worker = make_worker
+        self.grace = grace
+        self.health_timeout = health_timeout
+        self.state_dir = None
+        self._children = {}  # pid -> worker index
+        self._started_at = {}  # worker index -> time.time() of its last start
+        self._failures = {}  # worker index -> crashes in a row shortly after starting
+        self._restart_at = {}  # worker index -> when to restart it
+        self._stopping = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    def _spawn(self, index):
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(index)  # never returns
+        self._children[pid] = index
+        self._started_at[index] = time.time()
+
+    def _run_worker(self, index):
+        status = 1
+        try:
+            # Ctrl+C reaches the whole process group: let the parent decide
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            exchange = SnapshotExchange(self.state_dir, f"worker-{index}")
+            server = self.make_worker(self.socket, exchange)
+
+            def stop(signum, frame):
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+            signal.signal(signal.SIGTERM, stop)
+            server.serve_forever()
+            drain = getattr(server, "drain", None)
+            if drain is not None:
+                drain(self.grace)
+            status = 0
+        except BaseException:
+            import traceback
+            traceback.print_exc()
+        finally:
+            os._exit(status)
+
+    def _reap(self):
+        """Collect exited workers and schedule their restarts"""
+        while self._children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            index = self._children.pop(pid, None)
+            if index is None:
+                continue
+            SnapshotExchange.retire(self.state_dir, f"worker-{index}")
+            if self._stopping:
+                continue
+            if time.time() - self._started_at[index] < 5:
+                self._failures[index] = self._failures.get(index, 0) + 1
+            else:
+                self._failures[index] = 0
+            delay = min(0.5 * 2 ** (self._failures[index] - 1), MAX_RESTART_DELAY) \
+                if self._failures[index] else 0.0
+            print(f"⚠️  Worker {index} (pid {pid}) exited with status "
+                  f"{os.waitstatus_to_exitcode(status)}; restarting in {delay:.1f}s")
+            self._restart_at[index] = time.monotonic() + delay
+
+    def _check_health(self):
+        """Kill workers whose heartbeat stopped (the restart follows via _reap)"""
+        now = time.time()
+        for pid, index in list(self._children.items()):
+            if now - self._started_at[index] < self.health_timeout:
+                continue
+            beat = SnapshotExchange.last_published(self.state_dir, f"worker-{index}")
+            if beat is None or now - beat > self.health_timeout:
+                print(f"⚠️  Worker {index} (pid {pid}) is unresponsive; killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def serve_forever(self):
+        """Start the workers and supervise them until Ctrl+C or SIGTERM"""
+        self.state_dir = tempfile.mkdtemp(prefix="mcp-workers-")
+        previous = {sig: signal.signal(sig, self._request_stop) for sig in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            for index in range(self.workers):
+                self._spawn(index)
+            while not self._stopping:
+                time.sleep(POLL_INTERVAL)
+                self._reap()
+                if self._stopping:
+                    break
+                self._check_health()
+                now = time.monotonic()
+                for index, due in list(self._restart_at.items()):
+                    if now >= due:
+                        del self._restart_at[index]
+                        self._spawn(index)
+        finally:
+            self._stopping = True
+            self._stop_workers()
+            for sig, handler in previous.items():
+                signal.signal(sig, handler)
+
+    def _stop_workers(self):
+        for pid in list(self._children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.monotonic() + self.grace + 1
+        while self._children and time.monotonic() < deadline:
+            time.sleep(POLL_INTERVAL / 4)
+            self._reap()
+        for pid in list(self._children):
+            print(f"⚠️  Worker pid {pid} did not stop within {self.grace:.0f}s; killing it")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            os.waitpid(pid, 0)
+            del self._children[pid]
+
+    def shutdown(self):
+        self._stopping = True
+
+    def server_close(self):
+        self.socket.close()
+        if self.state_dir:
+            shutil.rmtree(self.state_dir, ignore_errors=True)
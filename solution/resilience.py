@@ -0,0 +1,122 @@
+"""
+Failure handling for the MCP client's tool calls.
+
+- RetryPolicy: capped exponential backoff with full jitter, honouring a
+  server's Retry-After in full, within a budget of total waiting per call
+- LatencyTracker: recent call latencies per tool, whose percentile sets
+  when a hedged (duplicate) request is sent for a slow call
+- CircuitBreaker: after `failure_threshold` failures in a row, calls fail
+  fast for `reset_timeout` seconds instead of waiting on a sick server;
+  then one trial call decides whether to close the circuit again
+"""
+
+import random
+import threading
+import time
+from collections import deque
+
+
+class RetryPolicy:
+    """
+    How many attempts to make and how long to wait between them. A call
+    waits at most `max_wait` seconds in total across its retries; when a
+    server's Retry-After would take it past that, it gives up rather than
+    retrying early into another refusal.
+    """
+
+    def __init__(self, max_attempts=3, base_delay=0.1, max_delay=2.0, max_wait=10.0, seed=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_wait = max_wait
+        self._random = random.Random(seed)
+
+    def delay(self, attempt, retry_after=None, waited=0.0):
+        """
+        Seconds to wait after failed attempt number `attempt` (1-based), or
+        None to give up: waiting would take the call's total past max_wait
+        """
+        if retry_after is not None:
+            # The server's own estimate; retrying sooner would just be refused again
+            return retry_after if waited + retry_after <= self.max_wait else None
+        # "Full jitter": spreads out clients that failed at the same moment
+        delay = self._random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        return delay if waited + delay <= self.max_wait else None
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies (seconds) per key"""
+
+    def __init__(self, window=200, min_samples=20):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, pct):
+        """The `pct` percentile of recent latencies, or None until min_samples are in"""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed"""
+
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True if a call may go ahead now (False = fail fast)"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_running = False
+            if self.state == self.HALF_OPEN and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or (self.failure_threshold > 0
+                                                and self.failures >= self.failure_threshold):
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_running = False
+
+    def retry_in(self):
+        """Seconds until an open circuit allows a trial call"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
@@ -0,0 +1,133 @@
+"""
+Routing-decision cache for the MCP client.
+
+Asking the model which tool to use is by far the slowest and most expensive
+step of a question, and the same questions come up again and again. This
+cache remembers the model's decision per (normalized question, manifest
+version): a different tool manifest means a different key, so decisions are
+never reused across tool changes. Entries expire after a TTL, the least
+recently used ones are evicted beyond `max_entries`, and the cache can be
+saved to a JSON file to survive across runs.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_question(question: str) -> str:
+    """Case, surrounding whitespace/punctuation and repeated spaces don't matter"""
+    return _SPACES.sub(" ", question.strip().lower()).rstrip("?!. ")
+
+
+class RoutingCache:
+    """Thread-safe LRU + TTL cache of model replies"""
+
+    def __init__(self, max_entries=1024, ttl=3600.0, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self._entries = OrderedDict()  # (question, version) -> (reply, stored_at)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, question: str, version: str):
+        """The cached reply, or None"""
+        if self.max_entries <= 0:
+            return None
+        key = (normalize_question(question), version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, question: str, version: str, reply: str):
+        if self.max_entries <= 0:
+            return
+        key = (normalize_question(question), version)
+        with self._lock:
+            self._entries[key] = (reply, time.time())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, keep_version=None):
+        """Drop every entry not made against `keep_version` (all, if None)"""
+        with self._lock:
+            stale = [key for key in self._entries if key[1] != keep_version]
+            for key in stale:
+                del self._entries[key]
+        return len(stale)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    def save(self, path=None):
+        """Write unexpired entries to `path` (atomically, via a temp file)"""
+        path = path or self.path
+        if not path:
+            return
+        now = time.time()
+        with self._lock:
+            entries = [[question, version, reply, stored_at]
+                       for (question, version), (reply, stored_at) in self._entries.items()
+                       if now - stored_at <= self.ttl]
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"entries": entries}, f)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        """
+        Merge entries saved by save(), skipping expired ones. A missing or
+        unreadable file loads nothing; malformed entries (a truncated or
+        hand-edited file) are skipped.
+        """
+        path = path or self.path
+        try:
+            with open(path, encoding="utf-8") as f:
+                entries = json.load(f).get("entries", [])
+        except (OSError, ValueError, AttributeError):
+            return
+        if not isinstance(entries, list):
+            return
+        now = time.time()
+        with self._lock:
+            for entry in entries[-self.max_entries:]:
+                try:
+                    question, version, reply, stored_at = entry
+                    fresh = now - stored_at <= self.ttl
+                except (TypeError, ValueError):
+                    continue
+                if fresh and all(isinstance(text, str) for text in (question, version, reply)):
+                    self._entries[(question, version)] = (reply, stored_at)
@@ -0,0 +1,267 @@
+"""
+Wire encodings for the simple MCP server and client.
+
+Responses are compact JSON by default. Clients can ask for MessagePack
+instead with `Accept: application/msgpack`, and send MessagePack request
+bodies with `Content-Type: application/msgpack`. MessagePack uses the
+`msgpack` package when it is installed and falls back to the small
+pure-Python codec below (same wire format, slower) when it is not.
+
+The encoders are built once and reused: json.dumps() with any non-default
+argument constructs a new JSONEncoder on every call, and the MessagePack
+fallback packs into a per-thread buffer instead of a fresh one per call.
+"""
+
+import json
+import struct
+import threading
+
+try:
+    import msgpack
+except ImportError:  # optional: the pure-Python codec below is used instead
+    msgpack = None
+
+JSON = "application/json"
+MSGPACK = "application/msgpack"
+MSGPACK_TYPES = (MSGPACK, "application/x-msgpack", "application/vnd.msgpack")
+
+_compact_json = json.JSONEncoder(separators=(",", ":"))
+_pretty_json = json.JSONEncoder(indent=2)
+
+
+def json_dumps(value, pretty=False):
+    """JSON bytes for `value`: compact, or indented for humans"""
+    return (_pretty_json if pretty else _compact_json).encode(value).encode()
+
+
+# --- MessagePack, pure-Python fallback (nil, bool, int, float, str, bin, array, map) ---
+
+_UINT8, _UINT16, _UINT32, _UINT64 = (struct.Struct(f">B{c}") for c in "BHIQ")
+_INT8, _INT16, _INT32, _INT64 = (struct.Struct(f">B{c}") for c in "bhiq")
+_FLOAT64 = struct.Struct(">Bd")
+_buffers = threading.local()
+
+
+def _pack(value, out):
+    kind = type(value)
+    if kind is float:
+        out += _FLOAT64.pack(0xcb, value)
+    elif kind is int:
+        if 0 <= value < 0x80:
+            out.append(value)
+        elif -0x20 <= value < 0:
+            out.append(value & 0xff)
+        elif value >= 0:
+            if value <= 0xff:
+                out += _UINT8.pack(0xcc, value)
+            elif value <= 0xffff:
+                out += _UINT16.pack(0xcd, value)
+            elif value <= 0xffffffff:
+                out += _UINT32.pack(0xce, value)
+            elif value <= 0xffffffffffffffff:
+                out += _UINT64.pack(0xcf, value)
+            else:
+                raise OverflowError("Integer value out of range")
+        elif value >= -0x80:
+            out += _INT8.pack(0xd0, value)
+        elif value >= -0x8000:
+            out += _INT16.pack(0xd1, value)
+        elif value >= -0x80000000:
+            out += _INT32.pack(0xd2, value)
+        elif value >= -0x8000000000000000:
+            out += _INT64.pack(0xd3, value)
+        else:
+            raise OverflowError("Integer value out of range")
+    elif kind is str:
+        data = value.encode()
+        size = len(data)
+        if size < 32:
+            out.append(0xa0 | size)
+        elif size <= 0xff:
+            out += _UINT8.pack(0xd9, size)
+        elif size <= 0xffff:
+            out += _UINT16.pack(0xda, size)
+        else:
+            out += _UINT32.pack(0xdb, size)
+        out += data
+    elif value is None:
+        out.append(0xc0)
+    elif kind is bool:
+        out.append(0xc3 if value else 0xc2)
+    elif kind is list or kind is tuple:
+        size = len(value)
+        if size < 16:
+            out.append(0x90 | size)
+        elif size <= 0xffff:
+            out += _UINT16.pack(0xdc, size)
+        else:
+            out += _UINT32.pack(0xdd, size)
+        for item in value:
+            _pack(item, out)
+    elif kind is dict:
+        size = len(value)
+        if size < 16:
+            out.append(0x80 | size)
+        elif size <= 0xffff:
+            out += _UINT16.pack(0xde, size)
+        else:
+            out += _UINT32.pack(0xdf, size)
+        for key, item in value.items():
+            _pack(key, out)
+            _pack(item, out)
+    elif kind is bytes or kind is bytearray:
+        size = len(value)
+        if size <= 0xff:
+            out += _UINT8.pack(0xc4, size)
+        elif size <= 0xffff:
+            out += _UINT16.pack(0xc5, size)
+        else:
+            out += _UINT32.pack(0xc6, size)
+        out += value
+    else:
+        # Subclasses (IntEnum, OrderedDict, ...) are packed as their base type
+        for base in (bool, int, float, str, list, dict):
+            if isinstance(value, base):
+                _pack(base(value), out)
+                return
+        raise TypeError(f"Object of type {kind.__name__} is not MessagePack serializable")
+
+
+def _packb(value):
+    out = getattr(_buffers, "out", None)
+    if out is None:
+        out = _buffers.out = bytearray()
+    try:
+        _pack(value, out)
+        return bytes(out)
+    finally:
+        out.clear()
+
+
+# format byte -> (struct, payload kind) for fixed-size headers
+_HEADERS = {
+    0xcc: (struct.Struct(">B"), "value"), 0xcd: (struct.Struct(">H"), "value"),
+    0xce: (struct.Struct(">I"), "value"), 0xcf: (struct.Struct(">Q"), "value"),
+    0xd0: (struct.Struct(">b"), "value"), 0xd1: (struct.Struct(">h"), "value"),
+    0xd2: (struct.Struct(">i"), "value"), 0xd3: (struct.Struct(">q"), "value"),
+    0xca: (struct.Struct(">f"), "value"), 0xcb: (struct.Struct(">d"), "value"),
+    0xd9: (struct.Struct(">B"), "str"), 0xda: (struct.Struct(">H"), "str"),
+    0xdb: (struct.Struct(">I"), "str"),
+    0xc4: (struct.Struct(">B"), "bin"), 0xc5: (struct.Struct(">H"), "bin"),
+    0xc6: (struct.Struct(">I"), "bin"),
+    0xdc: (struct.Struct(">H"), "array"), 0xdd: (struct.Struct(">I"), "array"),
+    0xde: (struct.Struct(">H"), "map"), 0xdf: (struct.Struct(">I"), "map"),
+}
+
+
+def _unpack(data, pos):
+    code = data[pos]
+    pos += 1
+    if code < 0x80:
+        return code, pos
+    if code >= 0xe0:
+        return code - 0x100, pos
+    if 0xa0 <= code <= 0xbf:
+        size = code & 0x1f
+        return str(data[pos:pos + size], "utf-8"), pos + size
+    if 0x90 <= code <= 0x9f:
+        kind, size = "array", code & 0x0f
+    elif 0x80 <= code <= 0x8f:
+        kind, size = "map", code & 0x0f
+    elif code == 0xc0:
+        return None, pos
+    elif code == 0xc2:
+        return False, pos
+    elif code == 0xc3:
+        return True, pos
+    else:
+        header = _HEADERS.get(code)
+        if header is None:
+            raise ValueError(f"unsupported MessagePack type 0x{code:02x}")
+        fmt, kind = header
+        (size,) = fmt.unpack_from(data, pos)
+        pos += fmt.size
+        if kind == "value":
+            return size, pos
+        if kind == "str":
+            return str(data[pos:pos + size], "utf-8"), pos + size
+        if kind == "bin":
+            return bytes(data[pos:pos + size]), pos + size
+    if kind == "array":
+        items = []
+        for _ in range(size):
+            item, pos = _unpack(data, pos)
+            items.append(item)
+        return items, pos
+    mapping = {}
+    for _ in range(size):
+        key, pos = _unpack(data, pos)
+        mapping[key], pos = _unpack(data, pos)
+    return mapping, pos
+
+
+def _unpackb(data):
+    try:
+        value, end = _unpack(memoryview(data), 0)
+    except (IndexError, struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"invalid MessagePack data: {e}") from None
+    if end != len(data):
+        raise ValueError("unexpected data after MessagePack value")
+    return value
+
+
+if msgpack is not None:
+    _packer = threading.local()
+
+    def msgpack_dumps(value):
+        packer = getattr(_packer, "packer", None)
+        if packer is None:
+            packer = _packer.packer = msgpack.Packer(use_bin_type=True)
+        return packer.pack(value)
+
+    def msgpack_loads(data):
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except (msgpack.ExtraData, msgpack.FormatError, msgpack.StackError, ValueError) as e:
+            raise ValueError(f"invalid MessagePack data: {e}") from None
+else:
+    msgpack_dumps = _packb
+    msgpack_loads = _unpackb
+
+
+def is_msgpack(content_type):
+    return (content_type or "").split(";", 1)[0].strip().lower() in MSGPACK_TYPES
+
+
+def negotiate(accept):
+    """The response media type for an Accept header: MSGPACK if preferred, else JSON"""
+    best, best_q = JSON, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = part.split(";")
+        media_type = media_type.strip().lower()
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type in MSGPACK_TYPES and q > best_q:
+            best, best_q = MSGPACK, q
+        elif media_type in (JSON, "application/*", "*/*") and q >= best_q and q > 0:
+            best, best_q = JSON, q
+    return best
+
+
+def dumps(value, media_type=JSON):
+    """Encode `value` as `media_type` (JSON or MSGPACK)"""
+    return msgpack_dumps(value) if media_type == MSGPACK else json_dumps(value)
+
+
+def loads(data, content_type=None):
+    """
+    Decode a body by its Content-Type: MessagePack for the msgpack types,
+    JSON for anything else (curl -d sends form-encoded headers for JSON)
+    """
+    return msgpack_loads(data) if is_msgpack(content_type) else json.loads(data)
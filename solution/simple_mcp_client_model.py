@@ -7,11 +7,28 @@ Claude Desktop is the client, Anthropic's servers run the model, and MCP servers
 In our workshop version, we've combined the Client and Model into one script for simplicity. In production MCP systems, these are often separate services.
 """
 
+# Startup matters: in per-request subprocess deployments every question pays
+# for this module's import. Heavy modules (requests, asyncio, the stdio
+# client's subprocess machinery, the model SDK) are imported where they are
+# first needed, and the HTTP session, stdio server and model client are all
+# created on first use. `python benchmark.py startup` tracks the cost.
+import argparse
+import array
+import atexit
+import base64
+import hashlib
 import os
-import requests
+import re
+import sys
+import threading
+import time
 import json
-from groq import Groq
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from model_backends import DEFAULT_GROQ_MODEL, create_backend
+from resilience import CircuitBreaker, LatencyTracker, RetryPolicy
+from routing_cache import RoutingCache
+import serialization
 
 load_dotenv(dotenv_path=".env.local", override=True)
 load_dotenv(dotenv_path=".env", override=False)
@@ -19,48 +36,348 @@ load_dotenv(dotenv_path=".env", override=False)
 base_url = os.getenv("BASE_API_URL")  # http://localhost:8000
 api_key = os.getenv("GROQ_API_KEY")
 
-client = Groq(api_key=api_key)
+# Model backend: "groq" (default) or "mock" for offline runs and benchmarks
+MODEL_BACKEND = os.getenv("MCP_MODEL_BACKEND", "groq")
+MODEL_NAME = os.getenv("MCP_MODEL", DEFAULT_GROQ_MODEL)
+MOCK_LATENCY = float(os.getenv("MCP_MOCK_LATENCY", "0"))
+DEFAULT_CONCURRENCY = max(1, int(os.getenv("MCP_CONCURRENCY", "8")))
+DAEMON_SOCKET = os.getenv("MCP_DAEMON_SOCKET")  # see client_daemon.py
+PLAN_CONCURRENCY = int(os.getenv("MCP_PLAN_CONCURRENCY", "4"))  # steps of one plan run at once
 
-def discover_tools():
+# Connection pooling: keep-alive connections are reused across tool calls.
+# IDLE_TIMEOUT should stay below the server's keep-alive timeout (15s) so we
+# never send on a connection the server has already closed.
+POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", "10"))
+IDLE_TIMEOUT = float(os.getenv("MCP_IDLE_TIMEOUT", "10"))
+# Compressed responses (large manifests and batches): by default advertise
+# every coding urllib3 can decode here (gzip, deflate, plus br/zstd when their
+# packages are installed); it decompresses transparently. "identity" turns
+# this off.
+ACCEPT_ENCODING = os.getenv("MCP_ACCEPT_ENCODING")
+
+_session = None
+_session_last_used = 0.0
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Shared requests.Session so every call reuses pooled HTTP/1.1 connections
+    instead of paying a new TCP handshake. Dropped and rebuilt after
+    IDLE_TIMEOUT seconds without use.
+    """
+    global _session, _session_last_used
+    with _session_lock:
+        now = time.monotonic()
+        if _session is not None and now - _session_last_used > IDLE_TIMEOUT:
+            _session.close()
+            _session = None
+        if _session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            from urllib3.util.request import ACCEPT_ENCODING as DECODABLE_ENCODINGS
+            _session = requests.Session()
+            _session.headers["Accept-Encoding"] = ACCEPT_ENCODING or DECODABLE_ENCODINGS
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        _session_last_used = now
+        return _session
+
+# Transport: HTTP to BASE_API_URL by default. With MCP_SERVER_COMMAND set
+# (e.g. "python simple_mcp_server.py --transport stdio") the client launches
+# the server itself and speaks JSON-RPC over its stdin/stdout instead.
+SERVER_COMMAND = os.getenv("MCP_SERVER_COMMAND")
+
+_stdio_client = None
+_stdio_lock = threading.Lock()
+
+def get_stdio_client():
+    """The stdio server process, launched (and initialized) on first use"""
+    global _stdio_client
+    with _stdio_lock:
+        if _stdio_client is None:
+            from jsonrpc import StdioClient
+            _stdio_client = StdioClient(SERVER_COMMAND, timeout=READ_TIMEOUT)
+            _stdio_client.initialize()
+            atexit.register(_stdio_client.close)
+        return _stdio_client
+
+# Federation: with MCP_SERVERS set ("url,name=url,...", see federation.py)
+# tools are discovered from all those servers in parallel and merged into
+# one index, and each call goes to the least busy server offering the tool
+# (each server has its own circuit breaker). BASE_API_URL is then unused.
+SERVERS = os.getenv("MCP_SERVERS")
+
+_federation = None
+_federation_lock = threading.Lock()
+
+def get_federation():
+    """The Federation over SERVERS, or None when talking to BASE_API_URL alone"""
+    global _federation
+    if not SERVERS:
+        return None
+    with _federation_lock:
+        if _federation is None:
+            from federation import Federation, parse_servers
+            _federation = Federation(parse_servers(SERVERS, lambda: CircuitBreaker(
+                circuit_breaker.failure_threshold, circuit_breaker.reset_timeout)))
+        return _federation
+
+@contextmanager
+def _route(tool_name):
+    """
+    (server URL, tool name there, circuit breaker) for one call attempt:
+    BASE_API_URL, or the least busy federated server offering the tool, where
+    the call counts as in flight until the block exits. The URL is None when
+    no federated server offers the tool.
+    """
+    federation = get_federation()
+    if federation is None:
+        yield base_url, tool_name, circuit_breaker
+        return
+    with federation.route(tool_name) as (server, remote_name):
+        if server is None:
+            yield None, tool_name, None
+        else:
+            yield server.url, remote_name, server.breaker
+
+# Failure handling for HTTP tool calls. Every request has a connect and a
+# read timeout. Idempotent tools (idempotentHint in the manifest, or listed in
+# MCP_IDEMPOTENT_TOOLS) are retried with jittered backoff on connection
+# errors, timeouts and 502/503/504; any tool is retried on a connect timeout,
+# 429, or 503 with Retry-After (the server refused the call before running it),
+# waiting the full Retry-After unless that would take the call's total waiting
+# past MCP_RETRY_MAX_WAIT seconds (then the refusal is returned instead).
+# With MCP_HEDGE_PERCENTILE set (e.g. 95), an idempotent call still running
+# after that percentile of its recent latencies gets a duplicate request, and
+# whichever answers first wins. After MCP_BREAKER_THRESHOLD failures in a row
+# calls fail fast for MCP_BREAKER_RESET seconds.
+CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.getenv("MCP_READ_TIMEOUT", "30"))
+IDEMPOTENT_TOOLS = set(filter(None, os.getenv("MCP_IDEMPOTENT_TOOLS", "").split(",")))
+HEDGE_PERCENTILE = float(os.getenv("MCP_HEDGE_PERCENTILE", "0"))
+RETRY_STATUSES = {429, 502, 503, 504}
+
+retry_policy = RetryPolicy(
+    max_attempts=int(os.getenv("MCP_RETRIES", "3")),
+    base_delay=float(os.getenv("MCP_RETRY_BASE_DELAY", "0.1")),
+    max_delay=float(os.getenv("MCP_RETRY_MAX_DELAY", "2")),
+    max_wait=float(os.getenv("MCP_RETRY_MAX_WAIT", "10")),
+)
+circuit_breaker = CircuitBreaker(
+    failure_threshold=int(os.getenv("MCP_BREAKER_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("MCP_BREAKER_RESET", "10")),
+)
+latency_tracker = LatencyTracker()
+_hedge_pool = None  # created by the first hedged call
+_hedge_lock = threading.Lock()
+
+def http_timeout():
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+# Wire encoding for tool calls: "json" (compact, the default) or "msgpack"
+# (smaller and cheaper to decode for large arrays; request bodies use it too)
+ENCODING = os.getenv("MCP_ENCODING", "json")
+
+def _encode_request(payload):
+    """
+    (body, headers) for a tool call request in ENCODING. Arguments MessagePack
+    can't carry (ints wider than 64 bits) are sent as JSON instead.
+    """
+    if ENCODING == "msgpack":
+        media_type = serialization.MSGPACK
+        try:
+            return serialization.msgpack_dumps(payload), {"Content-Type": media_type, "Accept": media_type}
+        except (OverflowError, TypeError, ValueError):
+            return serialization.json_dumps(payload), {"Content-Type": serialization.JSON, "Accept": media_type}
+    return serialization.json_dumps(payload), {"Content-Type": serialization.JSON}
+
+def decode_response(response):
+    """Decode a response body by its Content-Type (bytes in, no text decoding step)"""
+    return serialization.loads(response.content, response.headers.get("Content-Type"))
+
+# Manifest cache: within MANIFEST_TTL seconds discover_tools() answers from
+# memory; after that it revalidates with If-None-Match and only downloads
+# and parses the manifest again if the server says it changed.
+MANIFEST_TTL = float(os.getenv("MCP_MANIFEST_TTL", "30"))
+
+_manifest_cache = {"tools": None, "etag": None, "fetched_at": 0.0}
+_manifest_lock = threading.Lock()
+
+def _manifest_is_fresh():
+    cache = _manifest_cache
+    return cache["tools"] is not None and time.monotonic() - cache["fetched_at"] < MANIFEST_TTL
+
+def discover_tools(force_refresh: bool = False):
     """
     PROPER MCP: Dynamically discover what tools are available
-    Get tools from the server.
+    Get tools from the server (cached for MANIFEST_TTL seconds).
+    """
+    if not force_refresh and _manifest_is_fresh():
+        return _manifest_cache["tools"]
+    # One refresh at a time: concurrent callers wait and reuse its result
+    with _manifest_lock:
+        if not force_refresh and _manifest_is_fresh():
+            return _manifest_cache["tools"]
+        return _refresh_manifest()
+
+def _get_manifest(url, etag=None):
+    """(tools, ETag) from the server at `url`, or None if it still has `etag` (304)"""
+    headers = {"If-None-Match": etag} if etag else {}
+    response = get_session().get(f"{url}/_mcp/tools", headers=headers, timeout=http_timeout())
+    if response.status_code == 304:
+        return None
+    response.raise_for_status()
+    return decode_response(response), response.headers.get("ETag")
+
+def _refresh_manifest():
     """
+    Fetch the manifest over the configured transport (HTTP revalidated with
+    If-None-Match, stdio, or every federated server) and update the cache.
+    Without a server ETag (stdio, federation) the manifest is versioned by
+    its hash. A changed manifest makes the routing decisions made against
+    the old one stale.
+    """
+    cache = _manifest_cache
+    previous = cache["tools"]
+    errors = (OSError, ValueError)  # requests' errors are OSErrors
+    federation = get_federation() if SERVERS and not SERVER_COMMAND else None
     try:
-        response = requests.get(f"{base_url}/_mcp/tools")
-        response.raise_for_status()
-        tools = response.json()
-        print(f"🔍 Discovered {len(tools)} tools from server:")
-        for tool in tools:
-            print(f"  - {tool['name']}: {tool['description']}")
-        return tools
-    except requests.RequestException as e:
+        if SERVER_COMMAND:
+            from jsonrpc import JSONRPCError
+            errors += (JSONRPCError,)
+            tools = get_stdio_client().list_tools()
+            fetched = None if tools == previous else (tools, None)
+        elif federation is not None:
+            def fetch(server):
+                return _get_manifest(server.url, server.etag if server.tools is not None else None)
+            for server, error in federation.discover(fetch).items():
+                print(f"❌ Failed to discover tools from {server.name} ({server.url}): {error}")
+            tools = federation.tools
+            fetched = None if tools == previous else (tools, None)
+        else:
+            fetched = _get_manifest(base_url, cache["etag"] if previous is not None else None)
+    except errors as e:
         print(f"❌ Failed to discover tools: {e}")
-        return []
+        return previous or []
+    if fetched is None:
+        cache["fetched_at"] = time.monotonic()
+        return previous
+    
+    tools, etag = fetched
+    cache.update(tools=tools, etag=etag, fetched_at=time.monotonic())
+    cache["etag"] = _manifest_version(tools)  # the ETag, or the hash without one
+    if previous is not None:
+        routing_cache.invalidate(keep_version=cache["etag"])
+    if federation is None:
+        print(f"🔍 Discovered {len(tools)} tools from server:")
+    else:
+        print(f"🔍 Discovered {len(tools)} tools from {len(federation.servers)} servers:")
+    for tool in tools:
+        servers = ""
+        if federation is not None:
+            servers = " [" + ", ".join(sorted({server.name for server in federation.candidates(tool["name"])[1]})) + "]"
+        print(f"  - {tool['name']}: {tool['description']}{servers}")
+    return tools
+
+# Prompt rendering. Modes trade detail for prompt size:
+#   full    - tool definitions as indented JSON (the original format)
+#   compact - the same definitions as minified JSON
+#   summary - one signature line per tool, no JSON schema block
+# Each tool is rendered once per manifest version and mode, then reused for
+# every question. Above MAX_PROMPT_TOOLS tools, only the tools most relevant
+# to the question are included, so the prompt stays bounded.
+PROMPT_MODES = ("full", "compact", "summary")
+PROMPT_MODE = os.getenv("MCP_PROMPT_MODE", "compact")
+MAX_PROMPT_TOOLS = int(os.getenv("MCP_MAX_PROMPT_TOOLS", "20"))
+
+_WORD = re.compile(r"[a-z0-9]+")
+_rendered_tools = {}  # (manifest version, mode) -> (rendered tools, full tool section)
+
+def _manifest_version(available_tools: list) -> str:
+    """The server's ETag for the cached manifest, else a hash of the tools"""
+    if available_tools is _manifest_cache["tools"] and _manifest_cache["etag"]:
+        return _manifest_cache["etag"]
+    encoded = json.dumps(available_tools, sort_keys=True, separators=(",", ":")).encode()
+    return hashlib.sha1(encoded).hexdigest()
 
-def build_dynamic_prompt(question: str, available_tools: list) -> str:
+def _signature(tool: dict) -> str:
+    """e.g. add(a: number|array, b: number|array)"""
+    schema = tool.get("parameters") or {}
+    required = set(schema.get("required", ()))
+    params = []
+    for name, prop in schema.get("properties", {}).items():
+        types = prop.get("type", "any")
+        types = "|".join(types) if isinstance(types, list) else types
+        params.append(f"{name}{'' if name in required else '?'}: {types}")
+    return f"{tool['name']}({', '.join(params)})"
+
+def _render_tool(tool: dict, mode: str) -> dict:
+    if mode == "summary":
+        line = f"{_signature(tool)}: {tool['description']}"
+        definition = None
+    else:
+        line = f"{tool['name']}: {tool['description']}"
+        # Only what the model needs to pick and call a tool (no annotations)
+        tool = {key: tool[key] for key in ("name", "description", "parameters") if key in tool}
+        if mode == "full":
+            definition = json.dumps(tool, indent=4).replace("\n", "\n    ")
+        else:
+            definition = json.dumps(tool, separators=(",", ":"))
+    return {
+        "name": tool["name"],
+        "line": line,
+        "definition": definition,
+        "words": set(_WORD.findall(f"{tool['name']} {tool['description']}".lower())),
+    }
+
+def _tool_section(rendered: list, mode: str) -> str:
+    """The 'Available tools' (+ 'Tool Definitions') part of the prompt"""
+    tools_list = "\n".join(f"{i}. {tool['line']}" for i, tool in enumerate(rendered, 1))
+    if mode == "summary":
+        return f"Available tools:\n{tools_list}"
+    if mode == "full":
+        entries = ",\n".join(f"    {json.dumps(t['name'])}: {t['definition']}" for t in rendered)
+        tools_json = "{\n" + entries + "\n}" if entries else "{}"
+    else:
+        tools_json = "{" + ",".join(f"{json.dumps(t['name'])}:{t['definition']}" for t in rendered) + "}"
+    return f"Available tools:\n{tools_list}\n\nTool Definitions:\n{tools_json}"
+
+def _rendered_for(available_tools: list, mode: str):
+    key = (_manifest_version(available_tools), mode)
+    cached = _rendered_tools.get(key)
+    if cached is None:
+        rendered = [_render_tool(tool, mode) for tool in available_tools]
+        cached = (rendered, _tool_section(rendered, mode))
+        if len(_rendered_tools) >= 8:
+            _rendered_tools.clear()
+        _rendered_tools[key] = cached
+    return cached
+
+def select_relevant_tools(question: str, rendered: list, limit: int) -> list:
+    """The `limit` tools sharing the most words with the question, in manifest order"""
+    words = set(_WORD.findall(question.lower()))
+    scored = sorted(range(len(rendered)),
+                    key=lambda i: (-len(words & rendered[i]["words"]), i))
+    return [rendered[i] for i in sorted(scored[:limit])]
+
+def build_dynamic_prompt(question: str, available_tools: list, mode: str = None) -> str:
     """
     Build prompt using DISCOVERED tools, not hardcoded ones!
     """
-    # Convert discovered tools to prompt format
-    tool_descriptions = []
-    tool_definitions = {}
+    mode = mode or PROMPT_MODE
+    if mode not in PROMPT_MODES:
+        raise ValueError(f"Unknown prompt mode: {mode!r} (expected one of {PROMPT_MODES})")
     
-    for i, tool in enumerate(available_tools, 1):
-        tool_descriptions.append(f"{i}. {tool['name']}: {tool['description']}")
-        tool_definitions[tool['name']] = tool
-    
-    tools_list = "\n".join(tool_descriptions)
-    tools_json = json.dumps(tool_definitions, indent=4)
+    # Convert discovered tools to prompt format (cached per manifest version)
+    rendered, tool_section = _rendered_for(available_tools, mode)
+    if len(rendered) > MAX_PROMPT_TOOLS:
+        tool_section = _tool_section(select_relevant_tools(question, rendered, MAX_PROMPT_TOOLS), mode)
     
     return f"""
 You are a function router. Based on the user's query, decide whether to use a tool.
 
-Available tools:
-{tools_list}
-
-Tool Definitions:
-{tools_json}
+{tool_section}
 
 Respond in valid JSON only, like:
 {{
@@ -72,18 +389,360 @@ Respond in valid JSON only, like:
     }}
 }}
 
+If the query needs several tool calls, answer with all of them at once as a
+plan. A parameter value "$<id>" stands for the result of the step with that id:
+{{
+    "tool_use": true,
+    "plan": [
+        {{"id": "sum", "tool_name": "add", "parameters": {{"a": 2, "b": 3}}}},
+        {{"id": "diff", "tool_name": "substract", "parameters": {{"a": "$sum", "b": 1}}}}
+    ]
+}}
+
 Query: "{question}"
 """
 
-def call_tool(tool_name: str, parameters: dict):
-    """Same as before"""
-    url = f"{base_url}/{tool_name}"
+def unpack_float64(packed: dict) -> list:
+    """Decode the server's compact base64-f64 array encoding"""
+    values = array.array("d", base64.b64decode(packed["data"]))
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tolist()
+
+_idempotent = (None, frozenset())  # (manifest tools, names of idempotent tools)
+
+def is_idempotent(tool_name: str) -> bool:
+    """Safe to send twice: idempotentHint in the manifest, or MCP_IDEMPOTENT_TOOLS"""
+    global _idempotent
+    if tool_name in IDEMPOTENT_TOOLS:
+        return True
+    tools, names = _idempotent
+    if tools is not _manifest_cache["tools"]:
+        tools = _manifest_cache["tools"]
+        names = frozenset(tool["name"] for tool in tools or ()
+                          if (tool.get("annotations") or {}).get("idempotentHint"))
+        _idempotent = (tools, names)
+    return tool_name in names
+
+def _post(url, body, headers, params):
+    return get_session().post(url, data=body, headers=headers, params=params, timeout=http_timeout())
+
+def _send_hedged(tool_name, url, body, headers, params):
+    """
+    POST, and if no answer arrives within the hedge delay, POST again and
+    take whichever finishes first. Returns (response, seconds since the first
+    POST went out, requests sent). The slower request is left to finish in
+    the background.
+    """
+    global _hedge_pool
+    import requests
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    started = time.perf_counter()
+    delay = latency_tracker.percentile(tool_name, HEDGE_PERCENTILE)
+    if delay is None:
+        return _post(url, body, headers, params), time.perf_counter() - started, 1
+    with _hedge_lock:
+        if _hedge_pool is None:
+            _hedge_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="mcp-hedge")
+    futures = {_hedge_pool.submit(_post, url, body, headers, params)}
+    done, _ = wait(futures, timeout=delay)
+    if not done:
+        futures.add(_hedge_pool.submit(_post, url, body, headers, params))
+    requests_sent = len(futures)
+    error = None
+    while futures:
+        done, futures = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                return future.result(), time.perf_counter() - started, requests_sent
+            except requests.RequestException as e:
+                error = e
+    raise error
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+def call_tool(tool_name: str, parameters: dict, encoding: str = None):
+    """
+    Execute a tool on the server. Array arguments are applied element-wise;
+    pass encoding="f64" to receive large array results in packed form
+    (HTTP only; over stdio results are always plain JSON).
+    The result's "_meta" reports the attempts made, the HTTP requests
+    sent (hedges included) and the total time taken.
+    """
+    started = time.perf_counter()
+    if SERVER_COMMAND:
+        from jsonrpc import JSONRPCError
+        try:
+            result = get_stdio_client().call_tool(tool_name, parameters)
+        except (JSONRPCError, OSError) as e:
+            result = {"error": str(e)}
+        result["_meta"] = {"attempts": 1, "requests": 1,
+                           "elapsed_s": round(time.perf_counter() - started, 4)}
+        return result
+    import requests
+    params = {"encoding": encoding} if encoding else None
+    body, headers = _encode_request(parameters)
+    idempotent = is_idempotent(tool_name)
+    hedge = idempotent and HEDGE_PERCENTILE > 0
+    attempts = sent = 0
+    waited = 0.0
+    while True:
+        retry_after = None
+        with _route(tool_name) as (server_url, remote_name, breaker):
+            if server_url is None:
+                result = {"error": f"Unknown tool: {tool_name}"}
+                break
+            if not breaker.allow():
+                result = {"error": f"circuit open: {server_url} keeps failing, retrying in "
+                                   f"{breaker.retry_in():.1f}s"}
+                break
+            attempts += 1
+            url = f"{server_url}/{remote_name}"
+            try:
+                if hedge:
+                    response, seconds, requests_sent = _send_hedged(tool_name, url, body, headers, params)
+                else:
+                    attempt_started = time.perf_counter()
+                    response = _post(url, body, headers, params)
+                    seconds, requests_sent = time.perf_counter() - attempt_started, 1
+                sent += requests_sent
+            except requests.RequestException as e:
+                sent += 1
+                breaker.record_failure()
+                result = {"error": str(e)}
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+            else:
+                if response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                retry_after = _retry_after(response)
+                if response.status_code in RETRY_STATUSES:
+                    result = {"error": f"{response.status_code} {response.reason} for url: {response.url}",
+                              "status": response.status_code}
+                    retryable = idempotent or response.status_code == 429 or \
+                        (response.status_code == 503 and retry_after is not None)
+                else:
+                    retryable = False
+                    try:
+                        response.raise_for_status()
+                        result = decode_response(response)
+                        latency_tracker.record(tool_name, seconds)
+                    except (requests.RequestException, ValueError) as e:
+                        result = {"error": str(e)}
+        if not retryable or attempts >= retry_policy.max_attempts:
+            break
+        delay = retry_policy.delay(attempts, retry_after, waited)
+        if delay is None:
+            break
+        # Retries are routed again, so a federated call can move to a less busy replica
+        time.sleep(delay)
+        waited += delay
+    packed = result.get("result")
+    if isinstance(packed, dict) and packed.get("encoding") == "base64-f64":
+        result["result"] = unpack_float64(packed)
+    result["_meta"] = {"attempts": attempts, "requests": sent,
+                       "elapsed_s": round(time.perf_counter() - started, 4)}
+    return result
+
+def call_tools_batch(calls: list, concurrent: bool = False):
+    """
+    Execute many tool calls in one round trip via /_mcp/batch.
+    `calls` is a list of {"tool_name": ..., "parameters": {...}}; the result
+    list has one entry per call, in order (errors are reported per entry).
+    Over stdio the calls go out as one JSON-RPC batch.
+    """
+    if SERVER_COMMAND:
+        return _call_tools_batch_stdio(calls)
+    if SERVERS:
+        return _call_tools_batch_federated(get_federation(), calls, concurrent)
+    return _post_batch(base_url, calls, concurrent)
+
+def _post_batch(server_url: str, calls: list, concurrent: bool = False):
+    import requests
+    url = f"{server_url}/_mcp/batch"
+    params = {"concurrent": "1"} if concurrent else None
     try:
-        response = requests.post(url, json=parameters)
+        body, headers = _encode_request(calls)
+        response = get_session().post(url, data=body, headers=headers, params=params,
+                                      timeout=http_timeout())
         response.raise_for_status()
-        return response.json()
+        return decode_response(response)
+    except (requests.RequestException, ValueError) as e:
+        return [{"error": str(e)} for _ in calls]
+
+def _call_tools_batch_federated(federation, calls: list, concurrent: bool = False):
+    """
+    Route every call (least busy server first, so a batch spreads over
+    replicas), then send one /_mcp/batch per server, all in parallel
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from contextlib import ExitStack
+    results = [None] * len(calls)
+    groups = {}  # server -> [(index in calls, call as that server names it)]
+    with ExitStack() as in_flight:
+        for i, call in enumerate(calls):
+            server, remote_name = in_flight.enter_context(federation.route(call.get("tool_name")))
+            if server is None:
+                results[i] = {"error": f"Unknown tool: {call.get('tool_name')}"}
+            else:
+                groups.setdefault(server, []).append((i, {**call, "tool_name": remote_name}))
+        if not groups:
+            return results
+
+        def send(server, items):
+            if not server.breaker.allow():
+                return [{"error": f"circuit open: {server.url} keeps failing"}] * len(items)
+            batch = _post_batch(server.url, [call for _, call in items], concurrent)
+            if all("error" in result and "status" not in result for result in batch):
+                server.breaker.record_failure()  # the whole request failed
+            else:
+                server.breaker.record_success()
+            return batch
+
+        with ThreadPoolExecutor(max_workers=len(groups), thread_name_prefix="mcp-batch") as pool:
+            sent = {server: pool.submit(send, server, items) for server, items in groups.items()}
+            for server, future in sent.items():
+                for (i, _), result in zip(groups[server], future.result()):
+                    results[i] = result
+    return results
+
+def _call_tools_batch_stdio(calls: list):
+    from concurrent.futures import TimeoutError as FutureTimeoutError
+    from jsonrpc import JSONRPCError, StdioClient
+    try:
+        futures = get_stdio_client().batch(
+            [("tools/call", {"name": call.get("tool_name"), "arguments": call.get("parameters", {})})
+             for call in calls])
+    except OSError as e:
+        return [{"error": str(e)} for _ in calls]
+    deadline = time.monotonic() + READ_TIMEOUT
+    results, unanswered = [], []
+    for future in futures:
+        try:
+            results.append(StdioClient.tool_result(future.result(max(0.0, deadline - time.monotonic()))))
+        except FutureTimeoutError:
+            unanswered.append(future)
+            results.append({"error": f"tools/call: no response from the stdio server within {READ_TIMEOUT:g}s"})
+        except (JSONRPCError, OSError) as e:
+            results.append({"error": str(e)})
+    if unanswered:
+        get_stdio_client().discard(unanswered)
+    return results
+
+def _iter_batch_body(calls):
+    """Encode a batch lazily, so requests sends it as a chunked upload"""
+    yield b"["
+    for i, call in enumerate(calls):
+        yield (b"," if i else b"") + json.dumps(call).encode()
+    yield b"]"
+
+def stream_tools_batch(calls, concurrent: bool = False):
+    """
+    Like call_tools_batch, but streams both ways: `calls` (any iterable,
+    e.g. a generator) is uploaded as it is encoded, and each result is
+    yielded as soon as the server sends its NDJSON line ({"index": i, ...}).
+    Over stdio, and for federated calls (which may go to several servers),
+    the calls are sent as call_tools_batch and yielded once all have answered.
+    """
+    if SERVER_COMMAND or SERVERS:
+        for i, result in enumerate(call_tools_batch(list(calls), concurrent)):
+            yield {"index": i, **result}
+        return
+    import requests
+    url = f"{base_url}/_mcp/batch"
+    params = {"stream": "1", "concurrent": "1"} if concurrent else {"stream": "1"}
+    headers = {"Accept": "application/x-ndjson", "Content-Type": "application/json"}
+    try:
+        with get_session().post(url, data=_iter_batch_body(calls), params=params,
+                                headers=headers, stream=True, timeout=http_timeout()) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
     except requests.RequestException as e:
-        return {"error": str(e)}
+        yield {"error": str(e)}
+
+# Routing cache: model decisions per (normalized question, manifest version).
+# MCP_ROUTING_CACHE_SIZE=0 disables it; MCP_ROUTING_CACHE_FILE persists it.
+routing_cache = RoutingCache(
+    max_entries=int(os.getenv("MCP_ROUTING_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("MCP_ROUTING_CACHE_TTL", "3600")),
+    path=os.getenv("MCP_ROUTING_CACHE_FILE") or None,
+)
+if routing_cache.path:
+    atexit.register(routing_cache.save)
+
+_model_backend = None
+
+def get_model_backend():
+    """The configured model backend, created on first use"""
+    global _model_backend
+    if _model_backend is None:
+        if MODEL_BACKEND == "mock":
+            _model_backend = create_backend("mock", latency=MOCK_LATENCY)
+        else:
+            _model_backend = create_backend(MODEL_BACKEND, api_key=api_key, model=MODEL_NAME)
+    return _model_backend
+
+def set_model_backend(backend):
+    """Use `backend` (anything with complete(prompt) -> str) from now on"""
+    global _model_backend
+    _model_backend = backend
+
+def ask_model(prompt: str) -> str:
+    """Send the router prompt to the model and return its raw reply"""
+    return get_model_backend().complete(prompt)
+
+def route_question(question: str, available_tools: list):
+    """
+    The model's decision for `question`, from the routing cache when the
+    same question was already routed against this manifest version.
+    Returns (model_reply, cached).
+    """
+    version = _manifest_version(available_tools)
+    model_reply = routing_cache.get(question, version)
+    if model_reply is not None:
+        return model_reply, True
+    model_reply = ask_model(build_dynamic_prompt(question, available_tools))
+    try:
+        json.loads(model_reply)
+    except json.JSONDecodeError:
+        return model_reply, False  # don't remember replies we can't use
+    routing_cache.put(question, version, model_reply)
+    return model_reply, False
+
+def run_decision(decision: dict, available_tools: list):
+    """
+    Execute the model's decision: one tool call, or a plan of several with
+    independent steps run concurrently (see tool_plans.py). None when no
+    tool is needed. A single call returns call_tool's result; a plan returns
+    {"result": the last step's result, "steps": [...]}, plus "error" if any
+    step failed. Parameters that don't fit a tool's schema are reported
+    without calling the server.
+    """
+    if not decision.get("tool_use") or not (decision.get("plan") or decision.get("tool_name")):
+        return None
+    import tool_plans
+    tools = {tool["name"]: tool for tool in available_tools}
+    try:
+        steps = tool_plans.parse_plan(decision, tools)
+    except tool_plans.PlanError as e:
+        return {"error": f"Invalid tool plan: {e}"}
+    records = tool_plans.execute_plan(steps, tools, call_tool, max_workers=PLAN_CONCURRENCY)
+    if "plan" not in decision:
+        step = records[0]
+        return step["result"] if "result" in step else {"error": step["error"]}
+    outcome = {"result": records[-1].get("result", {}).get("result"), "steps": records}
+    errors = [f"step {step['id']}: {step.get('error') or step['result']['error']}"
+              for step in records if "error" in step or "error" in step.get("result", {})]
+    if errors:
+        outcome["error"] = "; ".join(errors)
+    return outcome
 
 def chat_with_model(question: str):
     """
@@ -100,31 +759,220 @@ def chat_with_model(question: str):
         print("No tools available!")
         return
     
-    # Step 2: Build prompt with discovered tools
-    dynamic_prompt = build_dynamic_prompt(question, available_tools)
+    # Step 2 + 3: Build prompt with discovered tools and let AI decide
+    # (skipped when this question was already routed: see route_question)
+    model_reply, cached = route_question(question, available_tools)
+    print("🤖 AI Decision (cached):" if cached else "🤖 AI Decision:", model_reply)
     
-    # Step 3: Let AI decide
-    chat_completion = client.chat.completions.create(
-        messages=[{"role": "user", "content": dynamic_prompt}],
-        model="llama3-8b-8192",
-    )
-    
-    model_reply = chat_completion.choices[0].message.content
-    print("🤖 AI Decision:", model_reply)
-    
-    # Step 4: Execute chosen tool
+    # Step 4: Execute chosen tool (or every step of the plan)
     try:
         parsed = json.loads(model_reply)
-        if parsed.get("tool_use") and parsed.get("tool_name") and parsed.get("parameters"):
-            result = call_tool(parsed["tool_name"], parsed["parameters"])
-            print("⚙️ Tool Result:", result)
-            return result
-        else:
+        result = run_decision(parsed, available_tools)
+        if result is None:
             print("No tool needed.")
+            return
+        for step in result.get("steps", ()):
+            print(f"⚙️ Step {step['id']} ({step['tool_name']}):", step.get("result", {"error": step.get("error")}))
+        print("⚙️ Tool Result:", result)
+        return result
     except json.JSONDecodeError:
         print("Failed to parse AI response.")
 
+def answer_question(question: str) -> dict:
+    """
+    The chat_with_model flow without printing, for batch runs. Returns a
+    record with the model's decision, the tool result (or error) and timings.
+    """
+    record = {"question": question}
+    started = time.perf_counter()
+    try:
+        available_tools = discover_tools()
+        if not available_tools:
+            record["error"] = "No tools available"
+            return record
+        
+        model_started = time.perf_counter()
+        model_reply, cached = route_question(question, available_tools)
+        record["decision"] = model_reply
+        record["cached"] = cached
+        record["model_s"] = round(time.perf_counter() - model_started, 4)
+        
+        parsed = json.loads(model_reply)
+        tool_started = time.perf_counter()
+        record["result"] = run_decision(parsed, available_tools)
+        if record["result"] is not None:
+            record["tool_s"] = round(time.perf_counter() - tool_started, 4)
+    except json.JSONDecodeError:
+        record["error"] = "Failed to parse AI response"
+    except Exception as e:  # one bad question must not sink the whole batch
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        record["elapsed_s"] = round(time.perf_counter() - started, 4)
+    return record
+
+async def answer_questions_async(questions, concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """
+    Answer many questions concurrently, at most `concurrency` at a time.
+    Each question's blocking model and tool calls run on a worker thread, so
+    while one question waits on the model others are calling tools.
+    Records come back in the same order as `questions`.
+    """
+    import asyncio
+    from concurrent.futures import ThreadPoolExecutor
+    loop = asyncio.get_running_loop()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="mcp-question") as executor:
+        return await asyncio.gather(*(
+            loop.run_in_executor(executor, answer_question, question)
+            for question in questions
+        ))
+
+def load_questions(path: str) -> list:
+    """
+    One question per line. JSON lines are accepted too: a string, or an
+    object with a "question" field (falling back to "title", which lets the
+    repo's requests.jsonl be replayed as-is).
+    """
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError:
+                item = line
+            if isinstance(item, dict):
+                item = item.get("question") or item.get("title")
+            if isinstance(item, str) and item:
+                questions.append(item)
+    return questions
+
+def answer_questions(questions, concurrency: int = DEFAULT_CONCURRENCY) -> list:
+    """Blocking wrapper around answer_questions_async"""
+    import asyncio
+    return asyncio.run(answer_questions_async(questions, concurrency))
+
+def run_questions(questions: list, output: str = None, concurrency: int = DEFAULT_CONCURRENCY,
+                  daemon: str = None):
+    """
+    Non-interactive mode: answer `questions`, write JSONL records. With
+    `daemon` (a socket path) they are handed to a warm --serve-daemon
+    process, falling back to answering here if none is running.
+    """
+    started = time.perf_counter()
+    records = None
+    if daemon:
+        import client_daemon
+        try:
+            records = client_daemon.ask(daemon, questions)
+        except (OSError, RuntimeError) as e:
+            print(f"⚠️  Client daemon on {daemon} unavailable ({e}); answering locally", file=sys.stderr)
+            daemon = None
+    if records is None:
+        records = answer_questions(questions, concurrency)
+    elapsed = time.perf_counter() - started
+    
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    try:
+        for record in records:
+            out.write(json.dumps(record) + "\n")
+    finally:
+        if output:
+            out.close()
+    rate = len(records) / elapsed if elapsed else 0.0
+    if daemon:
+        print(f"✅ Answered {len(records)} questions in {elapsed:.2f}s via the daemon on {daemon}",
+              file=sys.stderr)
+        return
+    print(f"✅ Answered {len(records)} questions in {elapsed:.2f}s "
+          f"({rate:.1f}/s, concurrency {concurrency})", file=sys.stderr)
+    print(f"🗂️ Routing cache: {routing_cache.stats()}", file=sys.stderr)
+
+def run_questions_file(path: str, output: str = None, concurrency: int = DEFAULT_CONCURRENCY,
+                       daemon: str = None):
+    """Answer every question in `path`, write JSONL records"""
+    run_questions(load_questions(path), output, concurrency, daemon)
+
+def serve_daemon(path: str, concurrency: int = DEFAULT_CONCURRENCY):
+    """
+    Run as a warm daemon on the Unix socket `path`: modules, model client,
+    HTTP connections, tool manifest and routing cache are set up once and
+    shared by every question handed over with --daemon.
+    """
+    import client_daemon
+    discover_tools()
+    get_model_backend()
+    server = client_daemon.DaemonServer(path, lambda questions: answer_questions(questions, concurrency))
+    print(f"🛰️ Client daemon listening on {path} (Ctrl+C to stop)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print("👋 Client daemon stopped", file=sys.stderr)
+
+def positive_int(value):
+    """argparse type for counts that must be at least 1"""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Proper MCP Client - Dynamic Tool Discovery")
+    parser.add_argument("--questions-file",
+                        help="answer every question in this file and exit (one per line, or JSONL)")
+    parser.add_argument("--question", action="append",
+                        help="answer this question (repeatable), print its JSONL record and exit")
+    parser.add_argument("--output", help="where to write JSONL results (default: stdout)")
+    parser.add_argument("--concurrency", type=positive_int, default=DEFAULT_CONCURRENCY,
+                        help="questions processed at once in --questions-file mode")
+    parser.add_argument("--daemon", default=DAEMON_SOCKET, metavar="PATH",
+                        help="hand --question/--questions-file questions to the warm daemon on this socket")
+    parser.add_argument("--serve-daemon", metavar="PATH",
+                        help="run as a warm daemon answering questions on this Unix socket")
+    parser.add_argument("--servers", default=SERVERS,
+                        help="federate these servers instead of BASE_API_URL: 'url,name=url,...' "
+                             "(servers sharing a name are replicas)")
+    parser.add_argument("--server-command", default=SERVER_COMMAND,
+                        help="launch the server with this command and talk JSON-RPC over stdio "
+                             "instead of HTTP (e.g. 'python simple_mcp_server.py --transport stdio')")
+    parser.add_argument("--encoding", choices=("json", "msgpack"), default=ENCODING,
+                        help="wire encoding for tool calls over HTTP")
+    parser.add_argument("--read-timeout", type=float, default=READ_TIMEOUT,
+                        help="seconds to wait for a tool call's response")
+    parser.add_argument("--retries", type=int, default=retry_policy.max_attempts,
+                        help="attempts per tool call (retries apply to idempotent tools and overload)")
+    parser.add_argument("--hedge-percentile", type=float, default=HEDGE_PERCENTILE,
+                        help="hedge idempotent calls slower than this latency percentile (0 = off)")
+    parser.add_argument("--backend", choices=("groq", "mock"), default=MODEL_BACKEND,
+                        help="model backend (mock = local rule-based router, no network)")
+    parser.add_argument("--mock-latency", type=float, default=MOCK_LATENCY,
+                        help="simulated seconds per model call for the mock backend")
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
+    args = parse_args()
+    MODEL_BACKEND = args.backend
+    MOCK_LATENCY = args.mock_latency
+    SERVER_COMMAND = args.server_command
+    SERVERS = args.servers
+    ENCODING = args.encoding
+    READ_TIMEOUT = args.read_timeout
+    retry_policy.max_attempts = max(1, args.retries)
+    HEDGE_PERCENTILE = args.hedge_percentile
+    # Keep at least one pooled connection per in-flight question
+    POOL_SIZE = max(POOL_SIZE, args.concurrency)
+    if args.serve_daemon:
+        serve_daemon(args.serve_daemon, args.concurrency)
+        sys.exit(0)
+    if args.questions_file or args.question:
+        questions = load_questions(args.questions_file) if args.questions_file else []
+        run_questions(questions + (args.question or []), args.output, args.concurrency, args.daemon)
+        sys.exit(0)
+    
     print("🚀 Proper MCP Client - Dynamic Tool Discovery")
     print("=" * 50)
     
@@ -4,127 +4,1177 @@ Simple MCP Server using only Python standard library
 Perfect for workshops - no dependency issues!
 """
 
-import json
+import argparse
+import array
+import asyncio
+import base64
+import collections
+import io
+import itertools
+import math
+import operator
+import random
+import http.client
 import http.server
+import selectors
+import socket
 import socketserver
-from datetime import datetime
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urlparse, parse_qs
 
+import content_encoding
+from admission import AdmissionControl, client_identity
+import metrics as mcp_metrics
+import serialization
+from json_stream import iter_json_array
+from jsonrpc import RPCDispatcher, serve_stdio
+from prefork import PreforkServer
+from tool_registry import ResultCache, ToolError, ToolRegistry, utc_timestamp
+
+try:
+    import numpy
+except ImportError:  # optional: array tools fall back to pure Python
+    numpy = None
+
+PORT = 8000
+SERVER_MODES = ("single", "threaded", "async")
+DEFAULT_MAX_CONCURRENCY = 32
+DEFAULT_BACKLOG = 128
+KEEPALIVE_TIMEOUT = 15  # seconds an idle keep-alive connection is held open
+MAX_BATCH_SIZE = 1000
+BATCH_WORKERS = 8
+MAX_ARRAY_LENGTH = 1_000_000
+MAX_BODY_SIZE = 64 * 1024 * 1024  # bytes; larger request bodies get a 413
+READ_CHUNK_SIZE = 64 * 1024
+RESULT_CACHE_ENTRIES = 4096  # memoized results of deterministic tools
+COMPRESS_MIN_SIZE = 1024  # smaller responses aren't worth compressing
+RESULT_CACHE_BYTES = 16 * 1024 * 1024
+NDJSON = 'application/x-ndjson'
+PROMETHEUS_TEXT = 'text/plain; version=0.0.4'
+KNOWN_ROUTES = {"/", "/_mcp/tools", "/_mcp/batch", "/_mcp/cache", "/_mcp/metrics", "/_mcp/clients"}
+# Never rate limited or shed, so the server stays observable under overload
+UNMETERED_ROUTES = {"/_mcp/metrics", "/_mcp/clients"}
+# Rejections are pre-encoded: turning a request away must stay cheap
+REJECTION_BODIES = {
+    429: serialization.json_dumps({"error": "Too many requests: over this client's rate limit"}),
+    503: serialization.json_dumps({"error": "Server overloaded: too many requests in flight"}),
+}
+_END = object()
+_Rejection = collections.namedtuple("_Rejection", "status retry_after")
+
+# Shared by every request that asks for concurrent batch execution
+batch_pool = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="mcp-batch")
+
+
+registry = ToolRegistry(ResultCache(max_entries=RESULT_CACHE_ENTRIES, max_bytes=RESULT_CACHE_BYTES))
+metrics = mcp_metrics.Metrics()
+admission = AdmissionControl()  # off until given a rate or an in-flight cap
+
+# A number, or an array of numbers to apply the tool to element-wise
+NUMBER_OR_ARRAY = {
+    "type": ["number", "array"],
+    "items": {"type": "number"},
+    "maxItems": MAX_ARRAY_LENGTH
+}
+
+NUMBER_PAIR = {
+    "type": "object",
+    "properties": {
+        "a": NUMBER_OR_ARRAY,
+        "b": NUMBER_OR_ARRAY
+    },
+    "required": ["a", "b"]
+}
+
+# NumPy's int64 arithmetic wraps around silently; ints below this bound in
+# magnitude can be added or subtracted without leaving int64
+INT64_SAFE = 2 ** 62
+
+def _numpy_operand(value):
+    """
+    `value` as a NumPy array (or scalar) on which + and - give exactly what
+    Python's numbers give, or None: only all-float or all-int (within
+    INT64_SAFE) operands qualify, since mixed lists would be coerced to
+    float64 and large ints would wrap or lose precision
+    """
+    kinds = set(map(type, value)) if isinstance(value, list) else {type(value)}
+    if kinds == {float}:
+        return numpy.asarray(value, dtype=numpy.float64)
+    if kinds == {int}:
+        try:
+            values = numpy.asarray(value, dtype=numpy.int64)
+        except OverflowError:
+            return None
+        if values.size and not -INT64_SAFE < values.min() <= values.max() < INT64_SAFE:
+            return None
+        return values
+    return None
+
+def elementwise(op, a, b):
+    """
+    Apply `op` (+ or -) to two numbers, or element-wise to equal-length
+    arrays, with a scalar broadcast against an array. Uses one NumPy pass
+    when NumPy is installed and the operands allow exact results (see
+    _numpy_operand), otherwise a single map() over the operator.
+    """
+    a_is_array = isinstance(a, list)
+    b_is_array = isinstance(b, list)
+    if not a_is_array and not b_is_array:
+        return op(a, b)
+    if a_is_array and b_is_array and len(a) != len(b):
+        raise ToolError(400, "a and b must have the same length")
+    if numpy is not None:
+        a_values, b_values = _numpy_operand(a), _numpy_operand(b)
+        if a_values is not None and b_values is not None:
+            return op(a_values, b_values).tolist()
+    if a_is_array and b_is_array:
+        return list(map(op, a, b))
+    if a_is_array:
+        return list(map(op, a, itertools.repeat(b)))
+    return list(map(op, itertools.repeat(a), b))
+
+def _query_flag(query, name):
+    """True if the query string turns flag `name` on (?name=1, true or yes)"""
+    return parse_qs(query).get(name, ["0"])[0].lower() in ("1", "true", "yes")
+
+def pack_float64(values):
+    """Compact encoding for large array results: base64 of little-endian float64"""
+    packed = array.array("d", values)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return {"encoding": "base64-f64", "length": len(packed),
+            "data": base64.b64encode(packed.tobytes()).decode("ascii")}
+
+@registry.tool("add", "Adds two numbers together (or two arrays of numbers element-wise).", NUMBER_PAIR,
+               deterministic=True)
+def add(a, b):
+    return elementwise(operator.add, a, b)
+
+@registry.tool("substract", "Subtract two numbers (or two arrays of numbers element-wise)", NUMBER_PAIR,
+               deterministic=True)
+def subtract(a, b):
+    return elementwise(operator.sub, a, b)
+
+
+class BodyTooLarge(Exception):
+    """The request body is bigger than the handler's max_body_size"""
+
+
 class MCPHandler(http.server.BaseHTTPRequestHandler):
+    # HTTP/1.1 keeps connections open between requests, so every response
+    # must carry a Content-Length (see send_body / send_error below).
+    protocol_version = "HTTP/1.1"
+    timeout = KEEPALIVE_TIMEOUT
+    # Headers and body go out as separate writes; without TCP_NODELAY the
+    # second write waits on a delayed ACK (~40ms) on a reused connection.
+    disable_nagle_algorithm = True
+    registry = registry
+    metrics = metrics
+    admission = admission
+    admission_applied = False  # True where the server applies admission control itself (async mode)
+    metrics_exchange = None  # set in pre-forked workers to report totals for all of them
+    max_body_size = MAX_BODY_SIZE
+    compress_min_size = COMPRESS_MIN_SIZE  # negative = never compress
+    access_log_sample = 1.0  # fraction of requests written to the access and error logs
+    body_drained = False  # the request body (if any) has been read to its end
+    
+    def parse_request(self):
+        """
+        Start timing once a request line and headers have been parsed, then
+        apply admission control: a rejected request is answered here, and
+        its body is never read
+        """
+        ok = super().parse_request()
+        if ok:
+            self.body_drained = (self.headers.get('Content-Length', '0') == '0'
+                                 and 'Transfer-Encoding' not in self.headers)
+            self.request_started_at = time.perf_counter()
+            self.response_status = None
+            self.phase_times = {}
+            self.metrics.request_started()
+            ok = self.admit()
+        return ok
+    
+    def admit(self):
+        """False (after sending 429/503) if admission control turns the request away"""
+        if (self.admission_applied or not self.admission.enabled
+                or urlparse(self.path).path in UNMETERED_ROUTES):
+            return True
+        rejection = self.admission.admit(client_identity(self.headers, self.client_address))
+        if rejection is None:
+            self.holds_admission_slot = True
+            return True
+        status, retry_after = rejection
+        if not self.body_drained:
+            self.close_connection = True  # the body is left unread
+        body = REJECTION_BODIES[status]
+        self.send_response(status)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Retry-After', str(math.ceil(retry_after)))
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+        return False
+    
+    def handle_one_request(self):
+        self.request_started_at = None
+        self.body_drained = False
+        self.holds_admission_slot = False
+        try:
+            super().handle_one_request()
+        finally:
+            if self.holds_admission_slot:
+                self.admission.leave()
+            if self.request_started_at is not None:
+                self.metrics.request_finished(self.metrics_route(), self.response_status,
+                                              time.perf_counter() - self.request_started_at,
+                                              self.phase_times)
+    
+    def metrics_route(self):
+        """Route label for metrics; unknown paths share "other" to bound cardinality"""
+        path = urlparse(self.path).path
+        if path in KNOWN_ROUTES or path.lstrip("/") in self.registry:
+            return path
+        return "other"
+    
+    def send_response(self, code, message=None):
+        self.response_status = code
+        super().send_response(code, message)
+    
+    def log_sampled(self):
+        """True for the access_log_sample fraction of log lines that get written"""
+        sample = self.access_log_sample
+        return sample >= 1 or (sample > 0 and random.random() < sample)
+    
+    def log_request(self, code='-', size='-'):
+        """Access log line for a request, written for a sample of requests only"""
+        if self.log_sampled():
+            super().log_request(code, size)
+    
+    def log_error(self, format, *args):
+        """
+        Error log line (4xx/5xx, timeouts), sampled like the access log so a
+        flood of rejected requests doesn't cost a write each
+        """
+        if self.log_sampled():
+            super().log_error(format, *args)
+    
+    def send_body(self, status, body, content_type='application/json', headers=None, compress=True):
+        """
+        Send a complete response with an explicit Content-Length, compressed
+        (gzip/zstd/br, per Accept-Encoding) if it is at least compress_min_size
+        """
+        if compress and 0 <= self.compress_min_size <= len(body):
+            headers = dict(headers or {})
+            vary = headers.get('Vary')
+            headers['Vary'] = f"{vary}, Accept-Encoding" if vary else 'Accept-Encoding'
+            coding = content_encoding.negotiate(self.headers.get('Accept-Encoding'))
+            if coding:
+                body = content_encoding.compress(body, coding)
+                headers['Content-Encoding'] = coding
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def wants_pretty(self):
+        """True if the client asked for indented JSON with ?pretty=1"""
+        if "pretty=" not in self.path:
+            return False
+        return _query_flag(urlparse(self.path).query, "pretty")
+    
+    def response_type(self):
+        """The negotiated response encoding (serialization.JSON or MSGPACK)"""
+        return serialization.negotiate(self.headers.get('Accept'))
+    
+    def send_json(self, status, payload):
+        """Send a JSON response (compact, or indented with ?pretty=1)"""
+        self.send_body(status, serialization.json_dumps(payload, self.wants_pretty()))
+    
+    def send_payload(self, status, payload):
+        """
+        Send `payload` as JSON or MessagePack, whichever the Accept header
+        prefers. Values MessagePack can't carry (ints wider than 64 bits) are
+        sent as JSON instead, which the Content-Type tells the client.
+        """
+        media_type = self.response_type()
+        body = None
+        if media_type == serialization.MSGPACK:
+            try:
+                body = serialization.msgpack_dumps(payload)
+            except (OverflowError, TypeError, ValueError):
+                media_type = serialization.JSON
+        if body is None:
+            body = serialization.json_dumps(payload, self.wants_pretty())
+        self.send_body(status, body, media_type, {'Vary': 'Accept'})
+    
+    def send_error(self, code, message=None, explain=None, headers=None):
+        """
+        Send a JSON error with a Content-Length. The stock send_error always
+        adds "Connection: close", which would throw away the keep-alive
+        connection on every bad request; here it is kept only if the request
+        body was read to its end. Otherwise the unread rest of the body
+        would be taken for the next request on the connection.
+        """
+        if not self.body_drained:
+            self.close_connection = True
+        message = message or self.responses.get(code, ("Error",))[0]
+        self.log_error("code %d, message %s", code, message)
+        self.send_response(code, message)
+        if self.close_connection:
+            self.send_header('Connection', 'close')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        body = b""
+        if code >= 200 and code not in (204, 304):
+            body = serialization.json_dumps({"error": message})
+            self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD' and body:
+            self.wfile.write(body)
+    
+    def send_tool_error(self, error):
+        """Report a ToolError, with Retry-After when the tool is overloaded"""
+        headers = {'Retry-After': str(error.retry_after)} if error.retry_after else None
+        self.send_error(error.status, error.message, headers=headers)
+    
+    def start_chunked(self, status, content_type):
+        """
+        Begin a streamed response with chunked transfer-encoding. HTTP/1.0
+        clients don't understand chunks, so they get a plain body that ends
+        when the connection closes.
+        """
+        self.chunked = self.request_version != 'HTTP/1.0'
+        self.send_response(status)
+        self.send_header('Content-type', content_type)
+        if self.chunked:
+            self.send_header('Transfer-Encoding', 'chunked')
+        else:
+            self.close_connection = True
+            self.send_header('Connection', 'close')
+        self.end_headers()
+    
+    def write_chunk(self, data):
+        if not data:
+            return
+        if self.chunked:
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+        else:
+            self.wfile.write(data)
+    
+    def end_chunked(self):
+        if self.chunked:
+            self.wfile.write(b"0\r\n\r\n")
+    
+    def iter_body(self):
+        """
+        Yield the request body in READ_CHUNK_SIZE pieces, from either a
+        Content-Length or a chunked body, raising BodyTooLarge as soon as it
+        exceeds max_body_size (before reading it, when the length is known).
+        """
+        if 'chunked' in self.headers.get('Transfer-Encoding', '').lower():
+            yield from self._iter_chunked_body()
+            return
+        remaining = int(self.headers.get('Content-Length', 0))
+        if remaining > self.max_body_size:
+            raise BodyTooLarge()
+        while remaining > 0:
+            chunk = self.rfile.read(min(READ_CHUNK_SIZE, remaining))
+            if not chunk:
+                return
+            remaining -= len(chunk)
+            yield chunk
+        self.body_drained = True
+    
+    def _iter_chunked_body(self):
+        total = 0
+        while True:
+            size = int(self.rfile.readline(65537).split(b";", 1)[0].strip() or b"0", 16)
+            if size == 0:
+                # Skip any trailers up to the blank line ending the body
+                while self.rfile.readline(65537) not in (b"\r\n", b"\n", b""):
+                    pass
+                self.body_drained = True
+                return
+            total += size
+            if total > self.max_body_size:
+                raise BodyTooLarge()
+            while size > 0:
+                chunk = self.rfile.read(min(READ_CHUNK_SIZE, size))
+                if not chunk:
+                    return
+                size -= len(chunk)
+                yield chunk
+            self.rfile.readline(65537)
+    
+    def read_body(self):
+        """The whole request body as bytes (bounded by max_body_size)"""
+        body = bytearray()
+        for chunk in self.iter_body():
+            body += chunk
+        return body
+    
+    def body_error(self, error):
+        """(status, message) for a request body we couldn't read or parse"""
+        if isinstance(error, BodyTooLarge):
+            return 413, f"Request body exceeds {self.max_body_size} bytes"
+        return 400, f"Invalid request body: {error}"
+    
+    def send_body_error(self, error):
+        """Reject a body we couldn't read; the rest of it is still unread"""
+        self.close_connection = True
+        self.send_error(*self.body_error(error))
+    
+    def send_manifest(self, manifest):
+        """
+        Serve the pre-encoded tool manifest (compressed once per coding, not
+        per request), answering 304 when unchanged
+        """
+        coding = None
+        if 0 <= self.compress_min_size <= len(manifest.body):
+            coding = content_encoding.negotiate(self.headers.get('Accept-Encoding'))
+        body, etag = manifest.encoded(coding)
+        validators = {
+            'ETag': etag,
+            'Last-Modified': manifest.last_modified,
+            'Cache-Control': 'no-cache',
+            'Vary': 'Accept-Encoding',
+        }
+        if manifest.matches(self.headers.get('If-None-Match'),
+                            self.headers.get('If-Modified-Since')):
+            self.send_response(304)
+            for name, value in validators.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+        if coding:
+            validators['Content-Encoding'] = coding
+        self.send_body(200, body, headers=validators, compress=False)
     
     def do_GET(self):
         """Handle GET requests"""
         path = urlparse(self.path).path
         
         if path == "/":
-            self.send_response(200)
-            self.send_header('Content-type', 'text/plain')
-            self.end_headers()
-            self.wfile.write(b"OK")
+            self.send_body(200, b"OK", 'text/plain')
             
         elif path == "/_mcp/tools":
-            self.send_response(200)
-            self.send_header('Content-type', 'application/json')
-            self.end_headers()
-            
-            tools = [
-                {
-                    "name": "add",
-                    "description": "Adds two numbers together.",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "a": {"type": "number"},
-                            "b": {"type": "number"}
-                        },
-                        "required": ["a", "b"]
-                    }
-                },
-                {
-                    "name": "substract",
-                    "description": "Subtract two numbers",
-                    "parameters": {
-                        "type": "object",
-                        "properties": {
-                            "a": {"type": "number"},
-                            "b": {"type": "number"}
-                        },
-                        "required": ["a", "b"]
-                    }
-                }
-            ]
-            
-            self.wfile.write(json.dumps(tools, indent=2).encode())
+            self.send_manifest(self.registry.manifest)
+        elif path == "/_mcp/cache":
+            self.send_json(200, self.registry.result_cache.stats())
+        elif path == "/_mcp/clients":
+            self.send_json(200, self.admission.stats())
+        elif path == "/_mcp/metrics":
+            snapshot, cache_stats = self.metrics.snapshot(), self.registry.result_cache.stats()
+            if self.metrics_exchange is not None:
+                snapshot, cache_stats = self.metrics_exchange.aggregate(snapshot, cache_stats)
+            text = mcp_metrics.render(snapshot, cache_stats)
+            self.send_body(200, text.encode(), PROMETHEUS_TEXT)
         else:
-            self.send_response(404)
-            self.end_headers()
+            self.send_error(404)
     
     def do_POST(self):
         """Handle POST requests"""
         path = urlparse(self.path).path
         
-        # Read request body
-        content_length = int(self.headers.get('Content-Length', 0))
-        body = self.rfile.read(content_length).decode('utf-8')
+        if path == "/_mcp/batch" and self.wants_stream():
+            self.handle_batch_stream()
+            return
+        
+        # Read request body (decoded straight from the bytes, no str copy);
+        # JSON unless Content-Type says MessagePack
+        started = time.perf_counter()
+        try:
+            body = self.read_body()
+        except (BodyTooLarge, ValueError) as e:
+            self.send_body_error(e)
+            return
+        
+        content_type = self.headers.get('Content-Type')
+        try:
+            data = serialization.loads(body, content_type)
+        except ValueError:
+            self.send_error(400, "Invalid MessagePack" if serialization.is_msgpack(content_type)
+                            else "Invalid JSON")
+            return
+        parsed = time.perf_counter()
+        self.phase_times["parse"] = parsed - started
+        
+        if path == "/_mcp/batch":
+            self.handle_batch(data)
+            return
         
         try:
-            data = json.loads(body)
-        except json.JSONDecodeError:
-            self.send_error(400, "Invalid JSON")
+            value, encoded = self.registry.evaluate(path.lstrip("/"), data)
+        except ToolError as e:
+            self.send_tool_error(e)
             return
+        dispatched = time.perf_counter()
+        self.phase_times["dispatch"] = dispatched - parsed
         
-        if path == "/add":
-            self.handle_add(data)
-        elif path == "/substract":
-            self.handle_subtract(data)
+        # Array results can also be packed float64, with ?encoding=f64
+        if isinstance(value, list) and parse_qs(urlparse(self.path).query).get("encoding") == ["f64"]:
+            self.send_payload(200, {"result": pack_float64(value), "timestamp": utc_timestamp()})
         else:
-            self.send_response(404)
-            self.end_headers()
+            self.send_result(value, encoded)
+        self.phase_times["serialize"] = time.perf_counter() - dispatched
+    
+    def send_result(self, value, encoded):
+        """
+        Send {"result": ..., "timestamp": ...} stamped with this request's
+        time. For compact JSON the already-encoded result (possibly from the
+        result cache) is spliced in rather than encoded again.
+        """
+        if self.response_type() != serialization.JSON or self.wants_pretty():
+            self.send_payload(200, {"result": value, "timestamp": utc_timestamp()})
+            return
+        body = b'{"result":' + encoded + b',"timestamp":"' + utc_timestamp().encode() + b'"}'
+        self.send_body(200, body, headers={'Vary': 'Accept'})
     
-    def handle_add(self, data):
-        """Handle addition tool"""
-        a = data.get("a")
-        b = data.get("b")
+    def run_tool(self, tool_name, data):
+        """Run one tool and return its result dict (raises ToolError)"""
+        return self.registry.call(tool_name, data)
+    
+    def run_batch_item(self, item):
+        """Run one batch entry, turning failures into an error entry"""
+        if not isinstance(item, dict):
+            return {"error": "batch items must be objects", "status": 400}
+        try:
+            return self.run_tool(item.get("tool_name"), item.get("parameters", {}))
+        except ToolError as e:
+            if e.retry_after:
+                return {"error": e.message, "status": e.status, "retry_after": e.retry_after}
+            return {"error": e.message, "status": e.status}
+    
+    def wants_stream(self):
+        """True if the client asked for NDJSON (Accept header or ?stream=1)"""
+        if NDJSON in self.headers.get('Accept', ''):
+            return True
+        return _query_flag(urlparse(self.path).query, "stream")
+    
+    def handle_batch_stream(self):
+        """
+        Streaming /_mcp/batch: items are parsed from the body as they arrive,
+        executed, and each result is sent back immediately as one NDJSON line
+        ({"index": i, ...}) in a chunked response. Memory stays bounded by one
+        item plus, with ?concurrent=1, up to 2 * BATCH_WORKERS pending results.
+        The body must be JSON: MessagePack can't be parsed incrementally here.
+        """
+        if serialization.is_msgpack(self.headers.get('Content-Type')):
+            self.close_connection = True
+            self.send_error(415, "Streamed batches must be JSON")
+            return
+        concurrent = _query_flag(urlparse(self.path).query, "concurrent")
+        items = iter_json_array(self.iter_body())
         
-        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
-            self.send_error(400, "a and b must be numbers")
+        # Parse the first item before committing to a 200, so an oversized or
+        # malformed body still gets a proper error status.
+        try:
+            first = next(items, _END)
+        except (BodyTooLarge, ValueError) as e:
+            self.send_body_error(e)
             return
+        if first is not _END:
+            items = itertools.chain([first], items)
         
-        result = {
-            "result": a + b,
-            "timestamp": datetime.utcnow().isoformat() + "Z"
-        }
+        self.start_chunked(200, NDJSON)
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(result, indent=2).encode())
-    
-    def handle_subtract(self, data):
-        """Handle subtraction tool"""
-        a = data.get("a")
-        b = data.get("b")
+        def emit(index, result):
+            self.write_chunk(serialization.json_dumps({"index": index, **result}) + b"\n")
         
-        if not isinstance(a, (int, float)) or not isinstance(b, (int, float)):
-            self.send_error(400, "a and b must be numbers")
+        pending = collections.deque()
+        error = None
+        try:
+            for index, item in enumerate(items if first is not _END else ()):
+                if index >= MAX_BATCH_SIZE:
+                    raise ValueError(f"batch exceeds {MAX_BATCH_SIZE} items")
+                if not concurrent:
+                    emit(index, self.run_batch_item(item))
+                    continue
+                pending.append((index, batch_pool.submit(self.run_batch_item, item)))
+                while pending and (pending[0][1].done() or len(pending) >= 2 * BATCH_WORKERS):
+                    done_index, future = pending.popleft()
+                    emit(done_index, future.result())
+        except (BodyTooLarge, ValueError) as e:
+            # Headers are already out, so report the failure in-band and
+            # close: the rest of the body is still unread.
+            self.close_connection = True
+            error = self.body_error(e)
+        
+        for done_index, future in pending:
+            emit(done_index, future.result())
+        if error:
+            status, message = error
+            self.write_chunk(serialization.json_dumps({"error": message, "status": status}) + b"\n")
+        self.end_chunked()
+    
+    def handle_batch(self, items):
+        """
+        Handle /_mcp/batch: an array of {"tool_name", "parameters"} items.
+        Results come back in the same order, one entry per item, with errors
+        reported per item. Pass ?concurrent=1 to run the items in parallel.
+        """
+        if not isinstance(items, list):
+            self.send_error(400, "Batch body must be a JSON array")
+            return
+        if len(items) > MAX_BATCH_SIZE:
+            self.send_error(413, f"Batch exceeds {MAX_BATCH_SIZE} items")
             return
         
-        result = {
-            "result": a - b,
-            "timestamp": datetime.utcnow().isoformat() + "Z"
-        }
+        concurrent = _query_flag(urlparse(self.path).query, "concurrent")
+        started = time.perf_counter()
+        if concurrent and len(items) > 1:
+            results = list(batch_pool.map(self.run_batch_item, items))
+        else:
+            results = [self.run_batch_item(item) for item in items]
+        dispatched = time.perf_counter()
+        self.phase_times["dispatch"] = dispatched - started
         
-        self.send_response(200)
-        self.send_header('Content-type', 'application/json')
-        self.end_headers()
-        self.wfile.write(json.dumps(result, indent=2).encode())
+        self.send_payload(200, results)
+        self.phase_times["serialize"] = time.perf_counter() - dispatched
+
+
+class ThreadPoolMCPServer(socketserver.TCPServer):
+    """
+    TCPServer that serves connections on a bounded pool of worker threads.
+    When every worker is busy the accept loop waits, so extra clients queue
+    up in the listen backlog instead of piling up inside the process.
+
+    A worker only holds a connection while a request is read and answered.
+    Between keep-alive requests the socket is parked in a selector and handed
+    back to the pool once the client's next request arrives, or closed after
+    the handler's keep-alive timeout, so idle clients never keep new ones
+    waiting and nothing has to be cut off to free a worker.
+    """
+    allow_reuse_address = True
+
+    def __init__(self, server_address, handler_class,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, backlog=DEFAULT_BACKLOG,
+                 bind_and_activate=True):
+        self.max_concurrency = max_concurrency
+        self.request_queue_size = backlog
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency,
+                                        thread_name_prefix="mcp-worker")
+        super().__init__(server_address, handler_class, bind_and_activate)
+        # Parked keep-alive connections, watched by one thread. Workers only
+        # queue handlers in _to_park; the watcher owns the selector.
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._wakeup_writer = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+        self._to_park = collections.deque()
+        self._park_lock = threading.Lock()
+        self._closing = False
+        self._watcher = threading.Thread(target=self._watch_parked, name="mcp-keepalive", daemon=True)
+        self._watcher.start()
+
+    def process_request(self, request, client_address):
+        self._slots.acquire()
+        self._pool.submit(self._serve_new_connection, request, client_address)
+
+    def _serve_new_connection(self, request, client_address):
+        try:
+            # BaseRequestHandler.__init__ would run setup/handle/finish in one
+            # go; the steps are driven here so the handler can be parked
+            handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+            handler.request, handler.client_address, handler.server = request, client_address, self
+            handler.setup()
+            handler.close_connection = True
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+            self._slots.release()
+            return
+        self._serve(handler, holds_slot=True)
+
+    def _serve(self, handler, holds_slot=False):
+        """Answer requests on `handler`'s connection until it closes or goes idle"""
+        parked = False
+        try:
+            while True:
+                handler.handle_one_request()
+                if handler.close_connection or self._closing:
+                    break
+                if not _has_buffered_input(handler):
+                    parked = self._park(handler)
+                    break
+        except Exception:
+            self.handle_error(handler.request, handler.client_address)
+        finally:
+            if not parked:
+                self._finish(handler)
+            if holds_slot:
+                self._slots.release()
+
+    def _finish(self, handler):
+        try:
+            handler.finish()
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(handler.request)
+
+    def _park(self, handler):
+        """Hand an idle keep-alive connection to the watcher; False when shutting down"""
+        timeout = handler.timeout
+        deadline = time.monotonic() + timeout if timeout is not None else math.inf
+        with self._park_lock:
+            if self._closing:
+                return False
+            self._to_park.append((handler, deadline))
+        self._wake_watcher()
+        return True
+
+    def _wake_watcher(self):
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            pass  # a wakeup is already pending (or the server is closed)
+
+    def _watch_parked(self):
+        selector = self._selector
+        while True:
+            with self._park_lock:
+                closing = self._closing
+                to_park, self._to_park = list(self._to_park), collections.deque()
+            for handler, deadline in to_park:
+                selector.register(handler.connection, selectors.EVENT_READ, (handler, deadline))
+            parked = [key for key in selector.get_map().values() if key.fileobj is not self._wakeup]
+            now = time.monotonic()
+            for key in parked:
+                handler, deadline = key.data
+                if closing or deadline <= now:
+                    selector.unregister(key.fileobj)
+                    self._finish(handler)
+            if closing:
+                return
+            deadlines = [key.data[1] for key in selector.get_map().values() if key.fileobj is not self._wakeup]
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+            for key, _ in selector.select(None if timeout == math.inf else timeout):
+                if key.fileobj is self._wakeup:
+                    try:
+                        while self._wakeup.recv(4096):
+                            pass
+                    except (BlockingIOError, OSError):
+                        pass
+                    continue
+                # The next request (or EOF) has arrived: back to the pool
+                selector.unregister(key.fileobj)
+                handler, _ = key.data
+                try:
+                    self._pool.submit(self._serve, handler)
+                except RuntimeError:  # the pool is shut down
+                    self._finish(handler)
+
+    def _stop_parking(self):
+        """Close parked connections now, and busy ones once their request is answered"""
+        with self._park_lock:
+            self._closing = True
+        self._wake_watcher()
+        self._watcher.join(1.0)
+
+    def drain(self, timeout):
+        """After shutdown(): wait up to `timeout` seconds for requests in progress"""
+        self._stop_parking()
+        return _wait_for_pool(self._pool, timeout)
+
+    def server_close(self):
+        super().server_close()
+        self._stop_parking()
+        self._pool.shutdown(wait=False)
+        self._selector.close()
+        self._wakeup.close()
+        self._wakeup_writer.close()
+
+
+def _has_buffered_input(handler):
+    """
+    True if the next request is already in the handler's read buffer or the
+    socket (a pipelining client): the worker goes straight on with it, since
+    parked sockets are only woken by new data. Never blocks.
+    """
+    sock = handler.connection
+    try:
+        sock.setblocking(False)
+        return bool(handler.rfile.peek(1))
+    except BlockingIOError:
+        return False
+    except OSError:
+        return True  # let the handler run into the error and close
+    finally:
+        try:
+            sock.settimeout(handler.timeout)
+        except OSError:
+            pass
+
+
+def _wait_for_pool(pool, timeout):
+    """Shut `pool` down, waiting at most `timeout` seconds; True if it finished"""
+    waiter = threading.Thread(target=pool.shutdown, daemon=True)
+    waiter.start()
+    waiter.join(timeout)
+    return not waiter.is_alive()
+
+
+def _request_path(request):
+    """The path of a raw request's target, without the query"""
+    parts = request.split(b" ", 2)
+    target = parts[1] if len(parts) == 3 else b""
+    return urlparse(target.decode("latin-1")).path
+
+
+class _BufferedHandlerMixin:
+    """
+    Runs a BaseHTTPRequestHandler against an already-read request instead of a
+    live socket. The raw request bytes arrive as `request`; the response bytes
+    are left on `self.response_bytes`.
+    """
+    admission_applied = True  # AsyncMCPServer admits requests before reading the body
+
+    def setup(self):
+        self.connection = None
+        self.rfile = io.BytesIO(self.request)
+        self.wfile = io.BytesIO()
+
+    def handle(self):
+        # Exactly one request; the event loop owns the keep-alive loop.
+        self.handle_one_request()
+
+    def finish(self):
+        self.response_bytes = self.wfile.getvalue()
+
+
+class AsyncMCPServer:
+    """
+    asyncio-based server with the same routes and handler as MCPHandler.
+    Socket I/O happens on the event loop, so slow clients only cost a
+    coroutine; the handler itself runs on a pool of `max_concurrency` threads.
+    Requests are read in full before the handler runs and responses are sent
+    once it returns, so streamed (NDJSON) responses arrive all at once here.
+    """
+
+    def __init__(self, server_address, handler_class,
+                 max_concurrency=DEFAULT_MAX_CONCURRENCY, backlog=DEFAULT_BACKLOG, sock=None):
+        self.max_concurrency = max_concurrency
+        self.backlog = backlog
+        self.handler_class = type(f"Buffered{handler_class.__name__}",
+                                  (_BufferedHandlerMixin, handler_class), {})
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency,
+                                        thread_name_prefix="mcp-async-worker")
+        self._loop = None
+        self._stopped = None
+        self._ready = threading.Event()
+        self._done = threading.Event()
+        # Bind eagerly (like TCPServer) so server_address is known up front.
+        self.socket = sock or socket.create_server(server_address, backlog=backlog)
+        self.server_address = self.socket.getsockname()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.server_close()
+
+    async def _read_request(self, reader, client_address):
+        """
+        Read one request head plus its body (Content-Length or chunked, kept
+        in wire format for the handler to decode); None on EOF. A body over
+        max_body_size is left unread: the handler answers 413 from the
+        headers alone and closes the connection. When admission control
+        turns the request away (over the client's rate, or at the cap on
+        requests in flight), the body isn't read either and a _Rejection is
+        returned instead.
+        """
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError:
+            return None
+        rejection = self._admit(head, client_address)
+        if rejection is not None:
+            return _Rejection(*rejection)
+        if not self._needs_slot(head):
+            return await self._read_body(reader, head)
+        try:
+            return await self._read_body(reader, head)
+        except BaseException:
+            self.handler_class.admission.leave()  # no handler will run to give the slot back
+            raise
+
+    def _admit(self, head, client_address):
+        """AdmissionControl.admit() for a raw request head (None: go ahead)"""
+        admission = self.handler_class.admission
+        if not admission.enabled or _request_path(head) in UNMETERED_ROUTES:
+            return None
+        headers = http.client.parse_headers(io.BytesIO(head.split(b"\r\n", 1)[-1]))
+        return admission.admit(client_identity(headers, client_address), enter=self._needs_slot(head))
+
+    async def _read_body(self, reader, head):
+        """`head` plus the body it announces"""
+        content_length = 0
+        chunked = False
+        for line in head.split(b"\r\n")[1:]:
+            name, _, value = line.partition(b":")
+            name = name.strip().lower()
+            if name == b"content-length":
+                content_length = int(value.strip() or 0)
+            elif name == b"transfer-encoding":
+                chunked = b"chunked" in value.lower()
+        max_body_size = self.handler_class.max_body_size
+        if chunked:
+            return head + await self._read_chunked(reader, max_body_size)
+        if content_length > max_body_size:
+            return head
+        body = await reader.readexactly(content_length) if content_length else b""
+        return head + body
+
+    async def _read_chunked(self, reader, max_body_size):
+        """Raw chunked body, stopping early (truncated) once it gets too big"""
+        parts = []
+        total = 0
+        while True:
+            size_line = await reader.readuntil(b"\r\n")
+            size = int(size_line.split(b";", 1)[0].strip() or b"0", 16)
+            parts.append(size_line)
+            if size == 0:
+                while (trailer := await reader.readuntil(b"\r\n")) != b"\r\n":
+                    parts.append(trailer)
+                parts.append(b"\r\n")
+                return b"".join(parts)
+            total += size
+            if total > max_body_size:
+                return b"".join(parts)
+            parts.append(await reader.readexactly(size + 2))
+
+    def _needs_slot(self, request):
+        """True if `request` (raw bytes, head first) counts against max_in_flight"""
+        if self.handler_class.admission.max_in_flight <= 0:
+            return False
+        return _request_path(request) not in UNMETERED_ROUTES
+
+    def _reject(self, writer, rejection):
+        """Answer 429/503 from the event loop, without a handler thread or the body"""
+        body = REJECTION_BODIES[rejection.status]
+        reason = http.HTTPStatus(rejection.status).phrase.encode()
+        writer.write(b"HTTP/1.1 %d %s\r\nContent-Type: application/json\r\n"
+                     b"Retry-After: %d\r\nConnection: close\r\nContent-Length: %d\r\n\r\n%s"
+                     % (rejection.status, reason, math.ceil(rejection.retry_after), len(body), body))
+        metrics = self.handler_class.metrics
+        metrics.request_started()
+        metrics.request_finished("other", rejection.status, 0.0)
+
+    def _run_handler(self, raw_request, client_address):
+        handler = self.handler_class(raw_request, client_address, self)
+        return handler.response_bytes, handler.close_connection
+
+    async def _handle_connection(self, reader, writer):
+        client_address = writer.get_extra_info("peername")
+        loop = asyncio.get_running_loop()
+        timeout = self.handler_class.timeout
+        try:
+            while True:
+                raw_request = await asyncio.wait_for(self._read_request(reader, client_address), timeout)
+                if not raw_request:
+                    break
+                if isinstance(raw_request, _Rejection):
+                    self._reject(writer, raw_request)
+                    await writer.drain()
+                    break
+                try:
+                    response, close = await loop.run_in_executor(
+                        self._pool, self._run_handler, raw_request, client_address)
+                finally:
+                    if self._needs_slot(raw_request):
+                        self.handler_class.admission.leave()
+                writer.write(response)
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    def _accept(self, reader, writer):
+        # Our own tasks (not start_server's), so shutdown can cancel and reap them
+        task = self._loop.create_task(self._handle_connection(reader, writer))
+        self._connections.add(task)
+        task.add_done_callback(self._connections.discard)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stopped = asyncio.Event()
+        self._connections = set()
+        server = await asyncio.start_server(self._accept, sock=self.socket)
+        self._ready.set()
+        async with server:
+            try:
+                await self._stopped.wait()
+            finally:
+                # Idle keep-alive connections would otherwise be cancelled in
+                # asyncio.run's teardown, each logging a CancelledError
+                connections = list(self._connections)
+                for task in connections:
+                    task.cancel()
+                await asyncio.gather(*connections, return_exceptions=True)
+
+    def serve_forever(self):
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._done.set()
+
+    def shutdown(self):
+        """Stop serve_forever() and wait for it to exit (call from another thread)."""
+        self._ready.wait()
+        self._loop.call_soon_threadsafe(self._stopped.set)
+        self._done.wait()
+
+    def drain(self, timeout):
+        """After shutdown(): wait up to `timeout` seconds for requests in progress"""
+        return _wait_for_pool(self._pool, timeout)
+
+    def server_close(self):
+        self.socket.close()
+        self._pool.shutdown(wait=False)
+
+
+def _adopt_socket(server, sock):
+    """Point an unbound socketserver server at an already listening socket"""
+    server.socket.close()
+    server.socket = sock
+    server.server_address = sock.getsockname()
+    return server
+
+
+def make_server(mode="single", port=PORT, host="", handler_class=MCPHandler,
+                max_concurrency=DEFAULT_MAX_CONCURRENCY, backlog=DEFAULT_BACKLOG, sock=None):
+    """
+    Build a server for the chosen concurrency mode:
+    - single:   the original one-request-at-a-time socketserver.TCPServer
+                (a keep-alive client holds it until KEEPALIVE_TIMEOUT)
+    - threaded: a bounded worker pool (ThreadPoolMCPServer)
+    - async:    an asyncio event loop (AsyncMCPServer)
+    Pass `sock` to serve on an already listening socket instead of binding
+    (as pre-forked workers do).
+    """
+    if mode == "single":
+        if sock is not None:
+            return _adopt_socket(socketserver.TCPServer((host, port), handler_class, False), sock)
+        return socketserver.TCPServer((host, port), handler_class)
+    if mode == "threaded":
+        server = ThreadPoolMCPServer((host, port), handler_class, max_concurrency=max_concurrency,
+                                     backlog=backlog, bind_and_activate=sock is None)
+        return server if sock is None else _adopt_socket(server, sock)
+    if mode == "async":
+        return AsyncMCPServer((host, port), handler_class,
+                              max_concurrency=max_concurrency, backlog=backlog, sock=sock)
+    raise ValueError(f"Unknown server mode: {mode!r} (expected one of {SERVER_MODES})")
+
+
+def make_prefork_server(workers, mode, port=PORT, host="", max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                        backlog=DEFAULT_BACKLOG, grace=10.0, health_timeout=10.0):
+    """`workers` processes, each running a `mode` server on one shared listening socket"""
+    sock = socket.create_server((host, port), backlog=backlog)
+
+    def make_worker(sock, exchange):
+        MCPHandler.metrics_exchange = exchange
+        exchange.start(lambda: (metrics.snapshot(), registry.result_cache.stats()))
+        return make_server(mode, port, host, max_concurrency=max_concurrency,
+                           backlog=backlog, sock=sock)
+
+    return PreforkServer(sock, workers, make_worker, grace=grace, health_timeout=health_timeout)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Simple MCP Server")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--transport", choices=("http", "stdio"), default="http",
+                        help="serve HTTP routes, or JSON-RPC on stdin/stdout (how MCP hosts launch servers)")
+    parser.add_argument("--rpc-workers", type=int, default=8,
+                        help="JSON-RPC requests handled at once in stdio mode (0 = one at a time)")
+    parser.add_argument("--mode", choices=SERVER_MODES, default="threaded",
+                        help="concurrency mode (default: threaded)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="server processes sharing the port, to use more than one core (POSIX only)")
+    parser.add_argument("--worker-grace", type=float, default=10.0,
+                        help="seconds workers get to finish requests in progress on shutdown")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY,
+                        help="max requests handled at once in threaded/async mode")
+    parser.add_argument("--backlog", type=int, default=DEFAULT_BACKLOG,
+                        help="listen backlog for pending connections")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="requests per second allowed per client (API key or IP); 0 = unlimited")
+    parser.add_argument("--rate-burst", type=float, default=None,
+                        help="requests a client may make in a burst (default: --rate-limit, at least 1)")
+    parser.add_argument("--max-in-flight", type=int, default=0,
+                        help="requests handled at once per process before answering 503; 0 = no cap")
+    parser.add_argument("--keepalive-timeout", type=float, default=KEEPALIVE_TIMEOUT,
+                        help="seconds an idle keep-alive connection is kept open")
+    parser.add_argument("--max-body-size", type=int, default=MAX_BODY_SIZE,
+                        help="largest request body accepted, in bytes (413 above)")
+    parser.add_argument("--compress-min-size", type=int, default=COMPRESS_MIN_SIZE,
+                        help="compress responses of at least this many bytes (-1 disables compression)")
+    parser.add_argument("--access-log-sample", type=float, default=1.0,
+                        help="fraction of requests to write to the access and error logs (0 disables them)")
+    parser.add_argument("--tool-threads", type=int, default=8,
+                        help="threads shared by tools registered with executor='thread'")
+    parser.add_argument("--tool-processes", type=int, default=None,
+                        help="processes shared by tools registered with executor='process' (default: CPU count)")
+    parser.add_argument("--result-cache-entries", type=int, default=RESULT_CACHE_ENTRIES,
+                        help="results memoized for deterministic tools (0 disables)")
+    parser.add_argument("--result-cache-bytes", type=int, default=RESULT_CACHE_BYTES,
+                        help="max total size of memoized results, in bytes")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    PORT = 8000
+    args = parse_args()
+    PORT = args.port
+    MCPHandler.timeout = args.keepalive_timeout
+    MCPHandler.max_body_size = args.max_body_size
+    MCPHandler.access_log_sample = args.access_log_sample
+    MCPHandler.compress_min_size = args.compress_min_size
+    admission.configure(args.rate_limit, args.rate_burst)
+    admission.max_in_flight = args.max_in_flight
+    registry.result_cache.max_entries = args.result_cache_entries
+    registry.result_cache.max_bytes = args.result_cache_bytes
+    registry.executors.workers["thread"] = args.tool_threads
+    registry.executors.workers["process"] = args.tool_processes or registry.executors.workers["process"]
+    
+    if args.transport == "stdio":
+        # stdout carries the protocol, so status messages go to stderr
+        print(f"🚀 MCP Server speaking JSON-RPC on stdio ({len(registry)} tools)", file=sys.stderr)
+        try:
+            serve_stdio(RPCDispatcher(registry), workers=args.rpc_workers)
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
     
-    with socketserver.TCPServer(("", PORT), MCPHandler) as httpd:
-        print(f"🚀 MCP Server running on http://localhost:{PORT}")
+    if args.workers > 1:
+        httpd = make_prefork_server(args.workers, args.mode, PORT, max_concurrency=args.max_concurrency,
+                                    backlog=args.backlog, grace=args.worker_grace)
+        workers = f", {args.workers} worker processes"
+    else:
+        httpd = make_server(args.mode, PORT, max_concurrency=args.max_concurrency,
+                            backlog=args.backlog)
+        workers = ""
+    with httpd:
+        print(f"🚀 MCP Server running on http://localhost:{PORT} ({args.mode} mode{workers})")
         print(f"📋 Tools available at: http://localhost:{PORT}/_mcp/tools")
+        if admission.enabled:
+            print(f"🚦 Admission control: per-client counters at http://localhost:{PORT}/_mcp/clients")
         test_command = '{"a": 5, "b": 3}'
         print(f"🧮 Test addition: curl -X POST http://localhost:{PORT}/add -H 'Content-Type: application/json' -d '{test_command}'")
         print("Press Ctrl+C to stop")
@@ -132,4 +1182,5 @@ if __name__ == "__main__":
         try:
             httpd.serve_forever()
         except KeyboardInterrupt:
-            print("\n👋 Server stopped")
\ No newline at end of file
+            pass
+        print("\n👋 Server stopped")
\ No newline at end of file
@@ -0,0 +1,259 @@
+"""
+Multi-step tool plans for the MCP client.
+
+A question like "add 2 and 3 then subtract 1" needs several tool calls.
+Instead of one model round trip per call, the router prompt lets the model
+answer with the whole plan at once:
+
+    {"tool_use": true, "plan": [
+        {"id": "sum", "tool_name": "add", "parameters": {"a": 2, "b": 3}},
+        {"id": "diff", "tool_name": "substract", "parameters": {"a": "$sum", "b": 1}}
+    ]}
+
+A parameter value "$<id>" stands for the result of step <id>. Each step
+runs as soon as the steps it refers to have finished, so independent steps
+run concurrently and dependent ones in order; a step whose input failed is
+skipped. The single-call form {"tool_name": ..., "parameters": ...} is a
+one-step plan.
+
+Parameters are checked against the tool's JSON Schema before anything is
+sent: once when the plan is parsed (references still open) and again with
+the references filled in. The validator covers the schema keywords tool
+definitions use: type, properties, required, additionalProperties, items,
+enum, minimum/maximum and minItems/maxItems.
+"""
+
+import re
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+MAX_PLAN_STEPS = 16
+_REFERENCE = re.compile(r"^\$([A-Za-z_][\w-]*)$")
+
+
+class PlanError(ValueError):
+    """The model's decision isn't a plan we can run"""
+
+
+class _Reference:
+    """A "$<id>" parameter value, filled in with that step's result"""
+
+    __slots__ = ("step_id",)
+
+    def __init__(self, step_id):
+        self.step_id = step_id
+
+    def __repr__(self):
+        return f"${self.step_id}"
+
+
+class Step:
+    __slots__ = ("id", "tool_name", "parameters", "depends_on")
+
+    def __init__(self, step_id, tool_name, parameters):
+        self.id = step_id
+        self.tool_name = tool_name
+        self.parameters = _parse_references(parameters)
+        self.depends_on = set(_references(self.parameters))
+
+
+def _parse_references(value):
+    if isinstance(value, str):
+        match = _REFERENCE.match(value)
+        return _Reference(match.group(1)) if match else value
+    if isinstance(value, dict):
+        return {key: _parse_references(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_parse_references(item) for item in value]
+    return value
+
+
+def _references(value):
+    if isinstance(value, _Reference):
+        yield value.step_id
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from _references(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from _references(item)
+
+
+def _resolve(value, results):
+    if isinstance(value, _Reference):
+        return results[value.step_id]
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    return value
+
+
+# --- JSON Schema (the subset tool definitions use) ---
+
+# The same type rules as the server's compiled validators (tool_registry.py),
+# so a plan that passes here isn't refused with a 400 halfway through: bools
+# are neither numbers nor integers, and 2.0 is a number but not an integer
+_TYPES = {
+    "object": lambda v: isinstance(v, dict),
+    "array": lambda v: isinstance(v, list),
+    "string": lambda v: isinstance(v, str),
+    "number": lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    "integer": lambda v: isinstance(v, int) and not isinstance(v, bool),
+    "boolean": lambda v: isinstance(v, bool),
+    "null": lambda v: v is None,
+}
+
+
+def validate(value, schema, path="parameters"):
+    """Messages for every way `value` breaks `schema` (empty if it doesn't)"""
+    if isinstance(value, _Reference) or not isinstance(schema, dict):
+        return []  # a result not known yet; checked again once it is
+    errors = []
+    expected = schema.get("type")
+    if expected is not None:
+        types = expected if isinstance(expected, list) else [expected]
+        if not any(_TYPES.get(name, lambda v: True)(value) for name in types):
+            return [f"{path}: expected {' or '.join(types)}, got {type(value).__name__}"]
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(f"{path}: must be one of {schema['enum']}")
+    if _TYPES["number"](value):
+        if "minimum" in schema and value < schema["minimum"]:
+            errors.append(f"{path}: must be >= {schema['minimum']}")
+        if "maximum" in schema and value > schema["maximum"]:
+            errors.append(f"{path}: must be <= {schema['maximum']}")
+    if isinstance(value, dict):
+        properties = schema.get("properties", {})
+        for name in schema.get("required", ()):
+            if name not in value:
+                errors.append(f"{path}: missing required '{name}'")
+        for name, item in value.items():
+            if name in properties:
+                errors += validate(item, properties[name], f"{path}.{name}")
+            elif schema.get("additionalProperties") is False:
+                errors.append(f"{path}: unexpected '{name}'")
+    if isinstance(value, list):
+        if "minItems" in schema and len(value) < schema["minItems"]:
+            errors.append(f"{path}: needs at least {schema['minItems']} items")
+        if "maxItems" in schema and len(value) > schema["maxItems"]:
+            errors.append(f"{path}: at most {schema['maxItems']} items allowed")
+        if isinstance(schema.get("items"), dict):
+            for i, item in enumerate(value):
+                errors += validate(item, schema["items"], f"{path}[{i}]")
+    return errors
+
+
+def parse_plan(decision, tools):
+    """
+    The Steps of the model's decision, checked against `tools` (name ->
+    definition): known tools, unique ids, references to other steps only,
+    no cycles, and parameters that fit the schemas. Raises PlanError.
+    """
+    if "plan" in decision:
+        raw_steps = decision["plan"]
+        if not isinstance(raw_steps, list) or not raw_steps:
+            raise PlanError("plan must be a non-empty list of steps")
+    else:
+        raw_steps = [{"id": "step1", "tool_name": decision.get("tool_name"),
+                      "parameters": decision.get("parameters")}]
+    if len(raw_steps) > MAX_PLAN_STEPS:
+        raise PlanError(f"plan has {len(raw_steps)} steps (at most {MAX_PLAN_STEPS} allowed)")
+
+    steps = []
+    for i, raw in enumerate(raw_steps, 1):
+        if not isinstance(raw, dict):
+            raise PlanError(f"step {i} must be an object")
+        step_id = str(raw.get("id") or f"step{i}")
+        if any(step.id == step_id for step in steps):
+            raise PlanError(f"duplicate step id '{step_id}'")
+        tool_name = raw.get("tool_name")
+        if tool_name not in tools:
+            raise PlanError(f"step '{step_id}': unknown tool {tool_name!r}")
+        parameters = raw.get("parameters", {})
+        if not isinstance(parameters, dict):
+            raise PlanError(f"step '{step_id}': parameters must be an object")
+        steps.append(Step(step_id, tool_name, parameters))
+
+    ids = {step.id for step in steps}
+    for step in steps:
+        unknown = step.depends_on - ids
+        if unknown or step.id in step.depends_on:
+            raise PlanError(f"step '{step.id}' refers to {', '.join(sorted(unknown or {step.id}))}, "
+                            f"which is not an earlier or later step")
+        errors = validate(step.parameters, tools[step.tool_name].get("parameters"))
+        if errors:
+            raise PlanError(f"step '{step.id}' ({step.tool_name}): {'; '.join(errors)}")
+
+    # Kahn's algorithm: every step must become runnable at some point
+    remaining = {step.id: set(step.depends_on) for step in steps}
+    while remaining:
+        ready = [step_id for step_id, deps in remaining.items() if not deps]
+        if not ready:
+            raise PlanError(f"steps {', '.join(sorted(remaining))} depend on each other in a cycle")
+        for step_id in ready:
+            del remaining[step_id]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return steps
+
+
+def execute_plan(steps, tools, call, max_workers=4):
+    """
+    Run `steps` with `call(tool_name, parameters) -> {"result": ...} or
+    {"error": ...}`, each as soon as its inputs are ready. Returns one record
+    per step, in plan order: {"id", "tool_name", "parameters", and "result"
+    (the call's reply) or "error"}.
+    """
+    records = {step.id: {"id": step.id, "tool_name": step.tool_name} for step in steps}
+    results = {}  # step id -> result value, for references
+    failed = set()
+    pending = list(steps)
+
+    def start(step):
+        """Fill in references and validate; False if the step can't be sent"""
+        record = records[step.id]
+        if step.depends_on & failed:
+            record["error"] = f"skipped: depends on failed step(s) {', '.join(sorted(step.depends_on & failed))}"
+            return False
+        record["parameters"] = parameters = _resolve(step.parameters, results)
+        errors = validate(parameters, tools[step.tool_name].get("parameters"))
+        if errors:
+            record["error"] = f"invalid parameters: {'; '.join(errors)}"
+            return False
+        return True
+
+    def finish(step, reply):
+        records[step.id]["result"] = reply
+        if "error" in reply:
+            failed.add(step.id)
+        else:
+            results[step.id] = reply.get("result")
+
+    if len(steps) == 1:
+        step = steps[0]
+        if start(step):
+            finish(step, call(step.tool_name, records[step.id]["parameters"]))
+        return [records[step.id]]
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="mcp-plan") as pool:
+        running = {}
+        while pending or running:
+            for step in list(pending):
+                blocked_by = step.depends_on - results.keys()
+                if blocked_by - failed:
+                    continue  # an input is still running or pending
+                pending.remove(step)
+                if start(step):
+                    running[pool.submit(call, step.tool_name, records[step.id]["parameters"])] = step
+                else:
+                    failed.add(step.id)
+            if not running:
+                continue
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    reply = future.result()
+                except Exception as e:
+                    reply = {"error": f"{type(e).__name__}: {e}"}
+                finish(step, reply)
+    return [records[step.id] for step in steps]
@@ -0,0 +1,468 @@
+"""
+Declarative tool registry for the simple MCP server.
+
+A tool is a plain Python function plus the JSON Schema of its parameters,
+registered once with the @registry.tool(...) decorator. The registry builds
+the /_mcp/tools manifest from those registrations and dispatches calls with
+a dict lookup and a validator compiled from the schema at registration time.
+
+Tools run inline on the request thread by default, which suits cheap tools
+like add. Heavy or untrusted tools can opt into a shared thread or process
+pool (ToolExecutors) with a per-tool timeout and a queue-depth limit.
+"""
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from collections import OrderedDict
+from datetime import datetime, timezone
+from email.utils import formatdate, parsedate_to_datetime
+
+import content_encoding
+from serialization import json_dumps
+
+
+class ToolError(Exception):
+    """
+    A tool call failed; carries the HTTP status to report, and for
+    overload (503) how many seconds the client should wait before retrying.
+    """
+
+    def __init__(self, status, message, retry_after=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.retry_after = retry_after
+
+
+class ToolManifest:
+    """
+    The /_mcp/tools payload, serialized once (compact JSON, pre-encoded) along
+    with the ETag and Last-Modified validators used for conditional GETs.
+    Compressed copies are made once per content coding, on first request.
+    """
+
+    def __init__(self, tools):
+        self.tools = tools
+        self.body = json.dumps(tools, separators=(",", ":")).encode()
+        self.etag = '"' + hashlib.sha256(self.body).hexdigest()[:16] + '"'
+        self.modified_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.last_modified = formatdate(self.modified_at.timestamp(), usegmt=True)
+        self._encoded = {None: (self.body, self.etag)}
+
+    def encoded(self, coding=None):
+        """(body, ETag) of the manifest compressed with `coding` (None = as is)"""
+        entry = self._encoded.get(coding)
+        if entry is None:
+            # Each representation gets its own ETag, e.g. "abc123-gzip"
+            entry = (content_encoding.compress(self.body, coding), f'{self.etag[:-1]}-{coding}"')
+            self._encoded[coding] = entry
+        return entry
+
+    def matches(self, if_none_match, if_modified_since):
+        """True if the client's cached copy is still current (-> 304)"""
+        if if_none_match is not None:
+            tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+            variant = self.etag[:-1] + "-"
+            return "*" in tags or any(tag == self.etag or tag.startswith(variant) for tag in tags)
+        if if_modified_since is not None:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            return self.modified_at <= since
+        return False
+
+
+# JSON Schema "type" -> (check, wording for error messages)
+_TYPE_CHECKS = {
+    "number": (lambda v: isinstance(v, (int, float)) and not isinstance(v, bool), "a number"),
+    "integer": (lambda v: isinstance(v, int) and not isinstance(v, bool), "an integer"),
+    "string": (lambda v: isinstance(v, str), "a string"),
+    "boolean": (lambda v: isinstance(v, bool), "a boolean"),
+    "array": (lambda v: isinstance(v, list), "an array"),
+    "object": (lambda v: isinstance(v, dict), "an object"),
+    "null": (lambda v: v is None, "null"),
+}
+
+# JSON Schema "type" -> Python types produced by json.loads, for checking
+# array items in bulk with set(map(type, items)) rather than one by one
+_ITEM_TYPES = {
+    "number": {int, float},
+    "integer": {int},
+    "string": {str},
+    "boolean": {bool},
+    "object": {dict},
+    "array": {list},
+    "null": {type(None)},
+}
+
+
+def _item_checks(name, prop):
+    """Checks for `items` / `maxItems` of an array-valued property"""
+    checks = []
+    if "maxItems" in prop:
+        limit = prop["maxItems"]
+        checks.append((name, (lambda v: not isinstance(v, list) or len(v) <= limit,),
+                       f"{name} may have at most {limit} items"))
+    item_types = prop.get("items", {}).get("type")
+    if item_types:
+        item_types = [item_types] if isinstance(item_types, str) else item_types
+        allowed = set().union(*(_ITEM_TYPES[t] for t in item_types))
+        wording = " or ".join(_TYPE_CHECKS[t][1] for t in item_types)
+        checks.append((name, (lambda v: not isinstance(v, list) or set(map(type, v)) <= allowed,),
+                       f"every item of {name} must be {wording}"))
+    return checks
+
+
+def compile_validator(schema):
+    """
+    Compile the parameters schema of a tool (an object with typed
+    properties, `required`, and optional `enum`, `items` and `maxItems`)
+    into one function that checks a call's arguments and returns them as
+    keyword arguments.
+    """
+    properties = schema.get("properties", {})
+    required = tuple(schema.get("required", ()))
+    names = tuple(properties)
+    checks = []
+    for name, prop in properties.items():
+        types = prop.get("type")
+        if types:
+            types = [types] if isinstance(types, str) else types
+            testers = tuple(_TYPE_CHECKS[t][0] for t in types)
+            wording = " or ".join(_TYPE_CHECKS[t][1] for t in types)
+            checks.append((name, testers, f"{name} must be {wording}"))
+        checks.extend(_item_checks(name, prop))
+        if "enum" in prop:
+            allowed = tuple(prop["enum"])
+            checks.append((name, (allowed.__contains__,), f"{name} must be one of {list(allowed)}"))
+
+    def validate(data):
+        if not isinstance(data, dict):
+            raise ToolError(400, "parameters must be a JSON object")
+        for name in required:
+            if name not in data:
+                raise ToolError(400, f"missing required parameter: {name}")
+        for name, testers, message in checks:
+            if name in data:
+                value = data[name]
+                if not any(test(value) for test in testers):
+                    raise ToolError(400, message)
+        return {name: data[name] for name in names if name in data}
+
+    return validate
+
+
+def utc_timestamp():
+    """The current time as an ISO-8601 UTC string, e.g. 2024-01-01T12:00:00.000000Z"""
+    return datetime.utcnow().isoformat() + "Z"
+
+
+def encode_result(value):
+    """Compact JSON bytes for a tool's return value"""
+    return json_dumps(value)
+
+
+class ResultCache:
+    """
+    Bounded LRU of results of deterministic tools, keyed on (tool name,
+    canonical JSON of the arguments). Each entry keeps the value and its
+    pre-encoded JSON bytes; the cache holds at most `max_entries` entries and
+    `max_bytes` of encoded results. Hit/miss counters are kept per tool.
+    """
+
+    # Arguments with longer arrays are not memoized: building the key would
+    # cost about as much as the call itself
+    MAX_KEY_ARRAY_LENGTH = 256
+    _key_encoder = json.JSONEncoder(sort_keys=True, separators=(",", ":"))
+
+    def __init__(self, max_entries=4096, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (value, encoded)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {}  # tool name -> {"hits", "misses", "evictions"}
+
+    def key(self, tool_name, kwargs):
+        """Cache key for a call, or None if it shouldn't be cached"""
+        for value in kwargs.values():
+            if isinstance(value, (list, dict)) and len(value) > self.MAX_KEY_ARRAY_LENGTH:
+                return None
+        return tool_name, self._key_encoder.encode(kwargs)
+
+    def _tool_stats(self, tool_name):
+        stats = self._stats.get(tool_name)
+        if stats is None:
+            stats = self._stats[tool_name] = {"hits": 0, "misses": 0, "evictions": 0}
+        return stats
+
+    def get(self, key):
+        """(value, encoded) for `key`, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            stats = self._tool_stats(key[0])
+            if entry is None:
+                stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            stats["hits"] += 1
+            return entry
+
+    def put(self, key, value, encoded):
+        if len(encoded) > self.max_bytes // 8:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[1])
+            self._entries[key] = (value, encoded)
+            self._bytes += len(encoded)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                evicted_key, (_, evicted) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self._tool_stats(evicted_key[0])["evictions"] += 1
+
+    def stats(self):
+        """Per-tool hit/miss/eviction counts and hit rates, plus totals"""
+        with self._lock:
+            tools = {}
+            for name, counts in self._stats.items():
+                lookups = counts["hits"] + counts["misses"]
+                tools[name] = dict(counts, hit_rate=round(counts["hits"] / lookups, 4) if lookups else 0.0)
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "tools": tools,
+            }
+
+
+class ToolExecutors:
+    """
+    Shared pools for tools that don't run inline. A pooled call waits at
+    most its tool's `timeout` (504 after that) and is refused with 503 and a
+    Retry-After estimate when `max_queue` calls of that tool are already
+    queued or running, so overload turns into quick rejections instead of
+    piling up request threads.
+
+    A timed-out call is cancelled if it hasn't started. Otherwise a thread
+    runs on in the background (threads can't be killed, but the request is
+    answered) and still counts against `max_queue` until it ends, while the
+    process pool is killed and replaced, which also fails the other calls
+    running in it (502 without Retry-After: they may already have run).
+    """
+
+    KINDS = ("thread", "process")
+
+    def __init__(self, thread_workers=8, process_workers=None):
+        self.workers = {"thread": thread_workers, "process": process_workers or os.cpu_count() or 1}
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, kind):
+        with self._lock:
+            pool = self._pools.get(kind)
+            if pool is None:
+                if kind == "thread":
+                    pool = ThreadPoolExecutor(max_workers=self.workers[kind],
+                                              thread_name_prefix="mcp-tool")
+                else:
+                    pool = ProcessPoolExecutor(max_workers=self.workers[kind])
+                self._pools[kind] = pool
+            return pool
+
+    def _discard(self, kind, pool):
+        """Replace a broken or stuck process pool, killing its workers"""
+        with self._lock:
+            if self._pools.get(kind) is pool:
+                del self._pools[kind]
+        kill_workers = getattr(pool, "kill_workers", None)  # Python 3.14+
+        if kill_workers is not None:
+            kill_workers()
+        else:
+            for process in list((getattr(pool, "_processes", None) or {}).values()):
+                process.kill()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def retry_after(self, tool):
+        """Seconds until the calls ahead of a new one should be done (at least 1)"""
+        return max(1, math.ceil(tool.queued * tool.mean_seconds / self.workers[tool.executor]))
+
+    def run(self, tool, kwargs):
+        """Run `tool` in its pool and wait for the value (raises ToolError)"""
+        with self._lock:
+            if tool.max_queue is not None and tool.queued >= tool.max_queue:
+                raise ToolError(503, f"{tool.name} is overloaded, try again later",
+                                retry_after=self.retry_after(tool))
+            tool.queued += 1
+        started = time.perf_counter()
+
+        def finished(_future=None):
+            # When the call really ends, not when we stop waiting for it
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                tool.queued -= 1
+                tool.mean_seconds += 0.2 * (elapsed - tool.mean_seconds)
+
+        pool = self.pool(tool.executor)
+        try:
+            future = pool.submit(tool.func, **kwargs)
+        except BrokenProcessPool:
+            finished()
+            self._discard(tool.executor, pool)
+            raise ToolError(502, f"{tool.name} failed: its worker process exited") from None
+        future.add_done_callback(finished)
+        try:
+            return future.result(tool.timeout)
+        except FutureTimeoutError:
+            if not future.cancel() and tool.executor == "process":
+                self._discard(tool.executor, pool)
+            raise ToolError(504, f"{tool.name} timed out after {tool.timeout:g}s") from None
+        except BrokenProcessPool:
+            self._discard(tool.executor, pool)
+            raise ToolError(502, f"{tool.name} failed: its worker process exited") from None
+
+    def stats(self):
+        with self._lock:
+            return {kind: {"workers": self.workers[kind], "started": kind in self._pools}
+                    for kind in self.KINDS}
+
+    def shutdown(self):
+        with self._lock:
+            pools, self._pools = list(self._pools.values()), {}
+        for pool in pools:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+
+class Tool:
+    """One registered tool: its function, schema and compiled validator"""
+
+    def __init__(self, name, description, parameters, func, deterministic=False, cache=None,
+                 executor=None, timeout=None, max_queue=None, executors=None):
+        if executor not in (None,) + ToolExecutors.KINDS:
+            raise ValueError(f"Unknown executor: {executor!r} (expected one of {ToolExecutors.KINDS})")
+        self.name = name
+        self.description = description
+        self.parameters = parameters
+        self.func = func
+        self.validate = compile_validator(parameters)
+        # Deterministic tools (same arguments -> same result) are memoized
+        self.deterministic = deterministic
+        self.cache = cache if deterministic else None
+        # None runs the tool inline; "thread" / "process" on the shared pools
+        self.executor = executor
+        self.executors = executors
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.queued = 0  # calls queued or running in the pool
+        self.mean_seconds = 0.0  # moving average of pooled call durations
+
+    def definition(self):
+        """
+        This tool's entry in the /_mcp/tools manifest. Deterministic tools
+        carry MCP's idempotentHint, which tells clients they are safe to retry.
+        """
+        definition = {"name": self.name, "description": self.description, "parameters": self.parameters}
+        if self.deterministic:
+            definition["annotations"] = {"readOnlyHint": True, "idempotentHint": True}
+        return definition
+
+    def evaluate(self, data):
+        """Validate `data` and run the tool: returns (value, encoded value)"""
+        kwargs = self.validate(data)
+        key = self.cache.key(self.name, kwargs) if self.cache is not None else None
+        if key is not None:
+            entry = self.cache.get(key)
+            if entry is not None:
+                return entry
+        if self.executor is None:
+            value = self.func(**kwargs)
+        else:
+            value = self.executors.run(self, kwargs)
+        encoded = encode_result(value)
+        if key is not None:
+            self.cache.put(key, value, encoded)
+        return value, encoded
+
+    def call(self, data):
+        """Validate `data`, run the tool and wrap its return value"""
+        value, _ = self.evaluate(data)
+        return {
+            "result": value,
+            "timestamp": utc_timestamp()
+        }
+
+
+class ToolRegistry:
+    """
+    Tools by name. Registering a tool invalidates the cached manifest, which
+    is rebuilt (and re-serialized) once on the next request rather than on
+    every request.
+    """
+
+    def __init__(self, result_cache=None, executors=None):
+        self._tools = {}
+        self._manifest = None
+        self.result_cache = result_cache or ResultCache()
+        self.executors = executors or ToolExecutors()
+
+    def tool(self, name, description, parameters, deterministic=False, **options):
+        """
+        Decorator: register `func` as a tool. Pass deterministic=True for
+        pure functions to memoize their results in the shared result cache,
+        and executor="thread" or "process" (with timeout= and max_queue=) to
+        run a heavy tool off the request thread.
+        """
+        def decorator(func):
+            self.register(name, description, parameters, func, deterministic, **options)
+            return func
+        return decorator
+
+    def register(self, name, description, parameters, func, deterministic=False,
+                 executor=None, timeout=None, max_queue=None):
+        self._tools[name] = Tool(name, description, parameters, func,
+                                 deterministic=deterministic, cache=self.result_cache,
+                                 executor=executor, timeout=timeout, max_queue=max_queue,
+                                 executors=self.executors)
+        self._manifest = None
+
+    def get(self, name):
+        return self._tools.get(name)
+
+    def __contains__(self, name):
+        return name in self._tools
+
+    def __len__(self):
+        return len(self._tools)
+
+    @property
+    def manifest(self):
+        manifest = self._manifest
+        if manifest is None:
+            manifest = self._manifest = ToolManifest([tool.definition() for tool in self._tools.values()])
+        return manifest
+
+    def _get_tool(self, name):
+        tool = self._tools.get(name)
+        if tool is None:
+            raise ToolError(404, f"Unknown tool: {name}")
+        return tool
+
+    def call(self, name, data):
+        """Run tool `name` with `data` and return its result dict (raises ToolError)"""
+        return self._get_tool(name).call(data)
+
+    def evaluate(self, name, data):
+        """Run tool `name`: (value, encoded value), possibly from the result cache"""
+        return self._get_tool(name).evaluate(data)